@@ -17,6 +17,11 @@ import string
 import random
 import operator
 import math
+import itertools
+import hashlib
+import bisect
+import multiprocessing
+from multiprocessing import shared_memory
 import numpy
 import numpy.polynomial.polynomial as poly
 
@@ -31,12 +36,17 @@ def run_moving_average():
 
    USAGE:                                      
        find_moving_avg.py <file name> <a period> <degree> <out file>    
-                   <option: nodrop = 0>
+                   <option: nodrop = 0> <option: chunk=<# of lines>>
                                            
        example 1: find_moving_avg.py input_data 10 4 out_data       
                (if you want to drop outlayers)             
        example 2: find_moving_avg.ps input_data 10 4 out_data  nodrop=0
                (if you want to use all the data to fit the line)   
+       example 3: find_moving_avg.py input_data 10 4 out_data  nodrop=1 chunk=1000000
+               (if the data are too large to fit in memory. the data must be
+                sorted in x; they are read and binned 1000000 lines at a time)
+       example 4: find_moving_avg.py input_data.npy 10 4 out_data  compact=float32
+               (keep the data in float32 arrays; see find_moving_average)
     Input
        file name:  input data file name in (indepedent depedent) format    
                the x and y are separated by a space            
@@ -44,6 +54,9 @@ def run_moving_average():
        nterms:     degree of polynomial fit
        outfile:    output file name
        nodrop:     indicator of how the outlyers will be treated
+       chunk:      if it is given, use streaming mode with this many lines per chunk
+       compact:    float32 or float64. if it is given, use compact memory mode.
+                   it cannot be used with chunk
 
     Output: outfile (named at input)
             columns: 1. x value (center of the period)
@@ -60,62 +73,58 @@ def run_moving_average():
 
     """                                         
 #
-#---- read input values; nodrop is an option
+#---- read input values; nodrop and chunk are options
 #
-    if len(sys.argv) == 5:
-        file    = sys.argv[1]
-        arange  = sys.argv[2]
-        nterms  = sys.argv[3]
-        outfile = sys.argv[4]
-        nodrop  = 0
-    elif len(sys.argv) == 6:
-        file    = sys.argv[1]
-        arange  = sys.argv[2]
-        nterms  = sys.argv[3]
-        outfile = sys.argv[4]
-        nodrop  = sys.argv[5]
+    if len(sys.argv) < 5:
+        print(run_moving_average.__doc__)
+        exit(1)
 
-    arange  = float(arange)
-    nterms  = int(nterms)
+    file    = sys.argv[1]
+    arange  = float(sys.argv[2])
+    nterms  = int(sys.argv[3])
+    outfile = sys.argv[4]
+    nodrop  = 0
+    chunk   = 0
+    compact = ''
+    for ent in sys.argv[5:]:
+        if ent.startswith('chunk'):
+            chunk   = int(ent.replace('chunk=', ''))
+        elif ent.startswith('compact'):
+            compact = ent.replace('compact=', '')
+        else:
+            nodrop  = int(ent.replace('nodrop=', ''))
+
+    if chunk > 0 and compact != '':
+        print('chunk and compact options cannot be used together')
+        exit(1)
+#
+#--- streaming mode: the data are read and binned chunk by chunk
+#
+    if chunk > 0:
+        results = stream_moving_average(file, arange, nterms, nodrop, chunk=chunk)
+    else:
 #
 #--- read data
 #
-    (x, y) = readData(file)
+        if compact != '':
+            (x, y) = readDataBulk(file, mmap=file.endswith('.npy'), dtype=compact)
+        else:
+            (x, y) = readDataBulk(file)
 #
 #-- calling the maion function
 #
-    [xcent, movavg, sigma, min_sv, max_sv, y_avg, y_min, y_max, y_sig]\
-                        = find_moving_average(x, y, arange, nterms, nodrop)
+        results = find_moving_average(x, y, arange, nterms, nodrop, compact=compact)
 #
 #--- print out the results
 #
-    with open('outfile', 'w') as fo:
-        for i in range(0, len(xcent)):
-            fo.write(str(xcent[i]))
-            fo.write('\t')
-            fo.write(str(movavg[i]))
-            fo.write('\t')
-            fo.write(str(sigma[i]))
-            fo.write('\t')
-            fo.write(str(min_sv[i]))
-            fo.write('\t')
-            fo.write(str(max_sv[i]))
-            fo.write('\t')
-            fo.write(str(y_avg[i]))
-            fo.write('\t')
-            fo.write(str(y_min[i]))
-            fo.write('\t')
-            fo.write(str(y_max[i]))
-            fo.write('\t')
-            fo.write(str(y_sig[i]))
-            fo.write('\n')
-
+    writeMovingAvg(outfile, results)
 
 #---------------------------------------------------------------------------------------
 #-- find_moving_average: compute moving average and lower and upper envelop of the data-
 #---------------------------------------------------------------------------------------
 
-def find_moving_average(xorg, yorg, arange, nterms, nodrop = 0):
+def find_moving_average(xorg, yorg, arange, nterms, nodrop = 0, tail = 0.005, cache_dir = '',\
+                        cache_size = 100000000, nproc = 1, envelope = (0, 100), compact = ''):
     """
    fit a moving average, a n-th degree polynomial, and an envelope to a given data (x, y)        
                                            
@@ -130,6 +139,23 @@ def find_moving_average(xorg, yorg, arange, nterms, nodrop = 0):
                    if they are not enough data points, take lower  
                    degree. otherwise, it may not give a good fit   
        ndrop = 0:  indicator of how the outlyers will be handled. See below
+       tail = 0.005: fraction of the data dropped at each end when the percentile
+                   cut is used. (bottom, top) pair can be given to use different
+                   fractions at each end
+       cache_dir = '': if it is given, the results are saved in and read from this
+                   directory. the key is a hash of the data and the parameters
+       cache_size: max total size of the cache in bytes. the least recently used 
+                   results are removed when it is exceeded
+       nproc = 1:  # of processes used to bin the data. the results are the same as
+                   with a single process
+       envelope = (0, 100): percentiles of each period used as the lower and upper
+                   envelope. e.g. (2, 98) gives envelopes which are not dominated
+                   by a few outlyers. the default (0, 100) is min and max
+       compact = '': 'float32' or 'float64'. if it is given, y and all the outputs
+                   are kept in contiguous numpy arrays of the type (x and xcent
+                   stay float64) and the data are processed in pieces so that
+                   no temporary array of the full size is created. see Memory below.
+                   nproc is not used in this mode
                                            
    OUTPUT:     an list of lists of:
                mvavg            a moving average           
@@ -151,71 +177,501 @@ def find_moving_average(xorg, yorg, arange, nterms, nodrop = 0):
            nodrop = 2: only 0.5% of both end will be dropped         
            nodrop = 3:  both mechanisms are not used              
        If there is no option, it will use both to exclude outlyers      
+       (in practice the percentile cut is applied only with nodrop = 2 or 9;
+        nodrop = 0 uses the 3 sigma method alone)
+
+   Memory:
+       In the compact mode the peak memory for n data points sorted in x is about
+           8n (x, float64) + 4n (y, float32) + n (outlyer mask)
+           + 4n (copy for the percentile cut; nodrop = 2)
+           + ~100 MB of per-piece temporaries + the per-period outputs,
+       i.e. at most 17 bytes per point with float32 (21 with float64). 10^9 points 
+       (about 30 years of 1 second data) fit in 16 GB. If x is not sorted, the sort 
+       adds 20 bytes per point. When the input is a memory-mapped .npy file 
+       (readDataBulk(file, mmap=True)), x and y are paged in from the disk as needed.
+       The default mode converts the data into float64 arrays and uses several
+       temporary arrays of the full size (about 60 bytes per point).
 
     """
+    if compact != '':
+        xorg  = numpy.asarray(xorg, dtype=numpy.float64)
+        yorg  = numpy.asarray(yorg, dtype=compact)
+    else:
+        xorg  = numpy.asarray(xorg, dtype=float)
+        yorg  = numpy.asarray(yorg, dtype=float)
 #
-#--- fit a straight line
+#--- check whether the same computation is already saved
 #
-    (intercept, slope) = fit_poly(xorg, yorg, 2)
+    if cache_dir != '':
+        key     = movingAvgCacheKey(xorg, yorg, arange, nterms, nodrop, tail, envelope)
+        results = readMovingAvgCache(cache_dir, key, compact)
+        if results is not None:
+            return results
 #
-#--- find 3 sigma distance from the fitted line
+#--- compact mode: outlyer rejection and binning are done piece by piece
 #
-    std    = findSlopeSigma(xorg, yorg, intercept, slope)
-    slimit = 3.0 * std
+    if compact != '':
+        (xcent, movavg, sigma, min_sv, max_sv)\
+                = compactMovingAvg(xorg, yorg, arange, nodrop, tail, envelope, compact)
+    else:
 #
-#--- find top and bottom 5% values
+#--- drop outliers if nodrop option indicates so
 #
-    (blimit, tlimit) = findCutValues(yorg)
+        mask  = findOutlierMask(xorg, yorg, nodrop, tail)
+        xdata = xorg[mask]
+        ydata = yorg[mask]
 #
-#--- drop outliers if nodrop option indicates so
+#--- find moving average
 #
-    xdata = []
-    ydata = []
-    for i in range(0, len(xorg)):
-        if nodrop == 0 or nodrop == 1:
-            diff = yorg[i] - intercept - slope * xorg[i]
-            if diff > slimit:
-                continue
-        if nodrop == 9 or nodrop == 2:
-            if yorg[i] < blimit or yorg[i] > tlimit:
-                continue
+        (xcent, movavg, sigma, min_sv, max_sv) = findMovingAvg(xdata, ydata, arange, nproc, envelope)
+#
+#--- n-th degree polynomial fitting: moving average, lower envelope, upper envelope
+#--- and standard deviation
+#
+    (y_avg, y_min, y_max, y_sig) = fitEnvelopes(xcent, movavg, sigma, min_sv, max_sv, nterms, compact)
+
+    results = [xcent, movavg, sigma, min_sv, max_sv, y_avg, y_min, y_max, y_sig]
+
+    if cache_dir != '':
+        writeMovingAvgCache(cache_dir, key, results, cache_size)
+
+    return results
+
+#---------------------------------------------------------------------------------------
+#-- movingAvgCacheKey: create a cache key from the data and the parameters           ---
+#---------------------------------------------------------------------------------------
+
+def movingAvgCacheKey(xorg, yorg, arange, nterms, nodrop, tail, envelope = (0, 100)):
+    """
+    create a cache key from the data and the parameters
+    Input:      xorg, yorg  --- data (numpy arrays)
+                arange, nterms, nodrop, tail, envelope --- see find_moving_average
+    Output:     key         --- hex digest string
+    """
+    hobj = hashlib.blake2b(digest_size=20)
+    for ent in (xorg, yorg):
+        ent = numpy.ascontiguousarray(ent)
+        hobj.update((str(len(ent)) + ent.dtype.str).encode())
+        hobj.update(memoryview(ent).cast('B'))
 
-        xdata.append(xorg[i])
-        ydata.append(yorg[i])
 #
-#--- find moving average
+#--- "c2": nodrop = 0 uses only the sigma cut; do not reuse entries made otherwise
+#
+    param = '%r:%r:%r:%r:c2' % (float(arange), int(nterms), str(nodrop), tail)
+    if tuple(envelope) != (0, 100):
+        param = param + ':%r' % (tuple(envelope),)
+    hobj.update(param.encode())
+
+    return hobj.hexdigest()
+
+#---------------------------------------------------------------------------------------
+#-- readMovingAvgCache: read saved moving average results                            ---
+#---------------------------------------------------------------------------------------
+
+def readMovingAvgCache(cache_dir, key, compact = ''):
+    """
+    read saved moving average results
+    Input:      cache_dir   --- cache directory
+                key         --- cache key (see movingAvgCacheKey)
+                compact     --- if 'float32' or 'float64', return arrays (see find_moving_average)
+    Output:     results     --- the list of lists of find_moving_average or None if not found
+    """
+    cfile = os.path.join(cache_dir, key + '.npy')
+    try:
+        table = numpy.load(cfile)
+    except (OSError, ValueError):
+        return None
+#
+#--- mark as recently used
+#
+    try:
+        os.utime(cfile)
+    except OSError:
+        pass
+
+    if compact != '':
+        return [table[0]] + [table[k].astype(compact) for k in range(1, len(table))]
+
+    return table.tolist()
+
+#---------------------------------------------------------------------------------------
+#-- writeMovingAvgCache: save moving average results and trim the cache              ---
+#---------------------------------------------------------------------------------------
+
+def writeMovingAvgCache(cache_dir, key, results, cache_size = 100000000):
+    """
+    save moving average results and remove least recently used ones if the cache
+    is larger than cache_size
+    Input:      cache_dir   --- cache directory
+                key         --- cache key (see movingAvgCacheKey)
+                results     --- the list of lists of find_moving_average
+                cache_size  --- max total size of the cache in bytes
+    Output:     <cache_dir>/<key>.npy
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+
+    cfile = os.path.join(cache_dir, key + '.npy')
+    tfile = cfile + '.' + str(os.getpid()) + '.tmp'
+    table = numpy.array([numpy.asarray(ent, dtype=float) for ent in results])
+#
+#--- write to a temporary file first so that a reader never sees a partial file
+#
+    with open(tfile, 'wb') as fo:
+        numpy.save(fo, table)
+    os.replace(tfile, cfile)
+#
+#--- remove the least recently used results
+#
+    clist = []
+    for ent in os.listdir(cache_dir):
+        if not ent.endswith('.npy'):
+            continue
+        try:
+            stat = os.stat(os.path.join(cache_dir, ent))
+        except OSError:
+            continue
+        clist.append((stat.st_mtime, stat.st_size, ent))
+
+    clist.sort()
+    total = sum([ent[1] for ent in clist])
+    for (mtime, size, ent) in clist:
+        if total <= cache_size or ent == key + '.npy':
+            break
+        try:
+            os.remove(os.path.join(cache_dir, ent))
+        except OSError:
+            pass
+        total -= size
+
+#---------------------------------------------------------------------------------------
+#-- buildBinPyramid: precompute period statistics at power-of-two multiples of a width -
+#---------------------------------------------------------------------------------------
+
+def buildBinPyramid(xorg, yorg, base, nodrop = 0, tail = 0.005, nlevel = 0):
+    """
+    precompute period statistics at a base width and at its power-of-two multiples.
+    moving averages for any multiple of the base width can then be computed with 
+    pyramid_moving_average without reading the data again
+    Input:      xorg    --- independent variable list
+                yorg    --- dependent variable list
+                base    --- the base period width
+                nodrop  --- indicator of how the outlyers will be handled
+                            (see find_moving_average)
+                tail    --- fraction of the data dropped at each end by the percentile cut
+                nlevel  --- # of levels; if 0, add levels until a single period is left
+    Output:     pyramid --- dictionary with:
+                            start   --- the beginning of the first period
+                            base    --- the base period width
+                            levels  --- a list of period statistics (see findBinStats);
+                                        levels[k] has the width of base * 2**k
+    """
+    xorg  = numpy.asarray(xorg, dtype=float)
+    yorg  = numpy.asarray(yorg, dtype=float)
+    mask  = findOutlierMask(xorg, yorg, nodrop, tail)
+    xdata = xorg[mask]
+    ydata = yorg[mask]
+
+    aind  = xdata.argsort(kind='stable')
+    xdata = xdata[aind]
+    ydata = ydata[aind]
+    if len(xdata) > 0:
+        start = xdata[0]
+    else:
+        start = 0.0
+
+    levels = [findBinStats(xdata, ydata, base, start)]
+    while (nlevel == 0 and len(levels[-1][0]) > 1) or (len(levels) < nlevel):
+        levels.append(coarsenBinStats(levels[-1], 2))
+
+    return {'start': start, 'base': base, 'levels': levels}
+
+#---------------------------------------------------------------------------------------
+#-- pyramid_moving_average: compute moving average from a precomputed bin pyramid     --
+#---------------------------------------------------------------------------------------
+
+def pyramid_moving_average(pyramid, arange, nterms):
+    """
+    compute moving average and envelopes from a precomputed bin pyramid
+    Input:      pyramid --- output of buildBinPyramid
+                arange  --- a period for a moving average; must be a multiple of 
+                            the base width of the pyramid
+                nterms  --- a degree of polynomial fitting
+    Output:     the same list of lists as find_moving_average
+    """
+    ratio  = float(arange) / pyramid['base']
+    factor = int(round(ratio))
+    if factor < 1 or abs(ratio - factor) > 1.0e-9 * ratio:
+        raise ValueError('pyramid_moving_average: arange must be a multiple of the base width')
 #
-    (xcent, movavg, sigma, min_sv, max_sv) = findMovingAvg(xdata, ydata, arange)
+#--- start from the coarsest level whose width divides arange
 #
-#--- n-th degree polynomial fitting: moving average
+    level = 0
+    while factor % 2 == 0 and level + 1 < len(pyramid['levels']):
+        factor //= 2
+        level   += 1
+
+    stats = coarsenBinStats(pyramid['levels'][level], factor)
+
+    (xcent, movavg, sigma, min_sv, max_sv) = binStatsToAvg(stats, pyramid['start'], arange)
+    (y_avg, y_min, y_max, y_sig) = fitEnvelopes(xcent, movavg, sigma, min_sv, max_sv, nterms)
+
+    return [xcent, movavg, sigma, min_sv, max_sv, y_avg, y_min, y_max, y_sig]
+
+#---------------------------------------------------------------------------------------
+#-- stream_moving_average: compute moving average of a large sorted data file by chunks-
+#---------------------------------------------------------------------------------------
+
+def stream_moving_average(file, arange, nterms, nodrop = 0, tail = 0.005, chunk = 1000000):
+    """
+    compute moving average and envelopes of a data file which is too large to be
+    read into memory. the file is read chunk by chunk and each chunk is binned
+    with findBinStats; only the per-bin statistics are kept in memory
+    Input:      file    --- input data file (see readDataBulk for the formats).
+                            the data must be sorted in the independent variable
+                arange  --- a period for a moving average
+                nterms  --- a degree of polynomial fitting
+                nodrop  --- indicator of how the outlyers will be handled
+                            (see find_moving_average)
+                tail    --- fraction of the data dropped at each end by the percentile cut
+                chunk   --- # of data points read at a time
+    Output:     the same list of lists as find_moving_average
+    Note:       when the outlyers are dropped the file is read more than once:
+                one pass for the straight line fit and its sigma, one for the 
+                percentile cut values, and one for the binning. the percentile cut
+                values are estimated from a 65536 bin histogram of the data
+    """
 #
-    if nterms > 0:
-        acoeff = fit_poly(xcent, movavg, nterms)       #---- polynomial coeff estimation
-        y_avg  = estimatepolyfit(xcent, acoeff)        #---- estimated fit
+#--- straight line fit and data range
 #
-#--- n-th degree polynomial fitting: lower envelope
+    if nodrop in (0, 1, 2, 9):
+        (intercept, slope, std, ymin, ymax) = streamLineFit(file, chunk)
+        slimit = 3.0 * std
 #
-        acoeff = fit_poly(xcent, min_sv, nterms)
-        y_min  = estimatepolyfit(xcent, acoeff)
+#--- the percentile cut values from a histogram of the data
+#
+    if nodrop in (2, 9):
+        (blimit, tlimit) = streamCutValues(file, ymin, ymax, tail, chunk)
+
+    xstart = None
+    xlast  = None
+    saved  = []
+    for (x, y) in readDataChunks(file, chunk):
+        if len(x) == 0:
+            continue
+        if (xlast is not None and x[0] < xlast) or numpy.any(numpy.diff(x) < 0):
+            raise ValueError('stream_moving_average: the data are not sorted in x')
+        xlast = x[-1]
 #
-#--- n-th degree polynomial fitting: upper envelope
+#--- drop outlyers
 #
-        acoeff = fit_poly(xcent, max_sv, nterms)
-        y_max  = estimatepolyfit(xcent, acoeff)
+        mask = numpy.ones(len(x), dtype=bool)
+        if nodrop in (0, 1):
+            mask &= (y - intercept - slope * x) <= slimit
+        if nodrop in (2, 9):
+            mask &= (y >= blimit) & (y <= tlimit)
+
+        x = x[mask]
+        y = y[mask]
+        if len(x) == 0:
+            continue
+        if xstart is None:
+            xstart = x[0]
 #
-#--- n-th degree polynomial fitting: standard deviation
+#--- bin the chunk; the last bin may continue into the next chunk and is merged below
 #
-        acoeff = fit_poly(xcent, sigma, nterms)
-        y_sig  = estimatepolyfit(xcent, acoeff)
+        saved.append(findBinStats(x, y, arange, xstart))
+
+    if xstart is None:
+        (xcent, movavg, sigma, min_sv, max_sv) = ([], [], [], [], [])
     else:
-        xcnt  = len(xcent)
-        y_avg = [0.0] * xcnt
-        y_min = [0.0] * xcnt
-        y_max = [0.0] * xcnt
-        y_sig = [0.0] * xcnt
+        stats = combineBinStats(saved)
+        (xcent, movavg, sigma, min_sv, max_sv) = binStatsToAvg(stats, xstart, arange)
+
+    (y_avg, y_min, y_max, y_sig) = fitEnvelopes(xcent, movavg, sigma, min_sv, max_sv, nterms)
 
     return [xcent, movavg, sigma, min_sv, max_sv, y_avg, y_min, y_max, y_sig]
 
+#---------------------------------------------------------------------------------------
+#-- streamLineFit: fit a straight line to a data file chunk by chunk                 ---
+#---------------------------------------------------------------------------------------
+
+def streamLineFit(file, chunk = 1000000):
+    """
+    fit a straight line to a data file chunk by chunk
+    Input:      file    --- input data file
+                chunk   --- # of data points read at a time
+    Output:     intercept, slope    --- the least sq. straight line fit
+                std                 --- the standard deviation of the residuals
+                ymin, ymax          --- min and max of the dependent variable
+    """
+    return fitLineChunks(readDataChunks(file, chunk))
+
+#---------------------------------------------------------------------------------------
+#-- fitLineChunks: fit a straight line to data given in pieces                       ---
+#---------------------------------------------------------------------------------------
+
+def fitLineChunks(chunks):
+    """
+    fit a straight line to data given in pieces. the centered moments of each
+    piece are merged so that the result does not suffer from the cancellation
+    Input:      chunks  --- iterator of (<x array>, <y array>)
+    Output:     intercept, slope    --- the least sq. straight line fit
+                std                 --- the standard deviation of the residuals
+                ymin, ymax          --- min and max of the dependent variable
+    """
+    tot  = 0
+    xavg = 0.0
+    yavg = 0.0
+    sxx  = 0.0
+    sxy  = 0.0
+    syy  = 0.0
+    ymin = numpy.inf
+    ymax = -numpy.inf
+    for (x, y) in chunks:
+        cnt = len(x)
+        if cnt == 0:
+            continue
+        cx  = x.mean(dtype=numpy.float64)
+        cy  = y.mean(dtype=numpy.float64)
+        dx  = x - cx
+        dy  = y - cy
+#
+#--- merge the moments of this chunk to the running moments
+#
+        new  = tot + cnt
+        ddx  = cx - xavg
+        ddy  = cy - yavg
+        fac  = float(tot) * cnt / new
+        sxx += numpy.dot(dx, dx) + ddx * ddx * fac
+        sxy += numpy.dot(dx, dy) + ddx * ddy * fac
+        syy += numpy.dot(dy, dy) + ddy * ddy * fac
+        xavg += ddx * cnt / new
+        yavg += ddy * cnt / new
+        tot   = new
+
+        ymin = min(ymin, y.min())
+        ymax = max(ymax, y.max())
+
+    if tot == 0:
+        return (0.0, 0.0, 0.0, 0.0, 0.0)
+
+    if sxx > 0:
+        slope = sxy / sxx
+    else:
+        slope = 0.0
+    intercept = yavg - slope * xavg
+    std       = math.sqrt(max(syy - slope * sxy, 0.0) / tot)
+
+    return (intercept, slope, std, ymin, ymax)
+
+#---------------------------------------------------------------------------------------
+#-- streamCutValues: estimate the bottom and top cut values of a data file           ---
+#---------------------------------------------------------------------------------------
+
+def streamCutValues(file, ymin, ymax, tail = 0.005, chunk = 1000000, nbin = 65536):
+    """
+    estimate the bottom and top cut values of a data file from a histogram
+    Input:      file        --- input data file
+                ymin, ymax  --- the range of the dependent variable
+                tail        --- fraction of the data to be cut at each end (see findCutValues)
+                chunk       --- # of data points read at a time
+                nbin        --- # of histogram bins
+    Output:     (ybot, ytop)--- bottom and top cut values. accurate to (ymax - ymin) / nbin
+    """
+    if isinstance(tail, (list, tuple)):
+        (bfrac, tfrac) = tail
+    else:
+        bfrac = tail
+        tfrac = tail
+
+    if ymax <= ymin:
+        return (ymin, ymax)
+
+    hist = numpy.zeros(nbin, dtype=numpy.int64)
+    for (x, y) in readDataChunks(file, chunk):
+        hist += numpy.histogram(y, bins=nbin, range=(ymin, ymax))[0]
+
+    tot   = hist.sum()
+    csum  = numpy.cumsum(hist)
+    edges = numpy.linspace(ymin, ymax, nbin + 1)
+#
+#--- the bins holding the bottom and the top cut positions in the sorted order
+#
+    kbot = int(bfrac * tot)
+    tlim = int(tfrac * tot)
+    if tlim == 0:
+        ktop = tot - 1
+    else:
+        ktop = tot - tlim
+
+    ybot = edges[numpy.searchsorted(csum, kbot, side='right')]
+    ytop = edges[numpy.searchsorted(csum, ktop, side='right') + 1]
+
+    return (ybot, ytop)
+
+#---------------------------------------------------------------------------------------
+#-- writeMovingAvg: write moving average results in a tab delimited table            ---
+#---------------------------------------------------------------------------------------
+
+def writeMovingAvg(outfile, results, block = 100000):
+    """
+    write moving average results in a tab delimited table
+    Input:      outfile --- output file name
+                results --- a list of lists returned by find_moving_average
+                block   --- # of rows written at a time
+    Output:     outfile --- 9 column table (see run_moving_average)
+    """
+    table = numpy.column_stack([numpy.asarray(ent, dtype=float) for ent in results])
+
+    with open(outfile, 'w') as fo:
+        for k in range(0, len(table), block):
+            numpy.savetxt(fo, table[k:k+block], fmt='%.17g', delimiter='\t')
+
+#---------------------------------------------------------------------------------------
+#--  readDataChunks: read two column data from a given data file chunk by chunk      ---
+#---------------------------------------------------------------------------------------
+
+def readDataChunks(file, chunk = 1000000):
+    """
+     read two column data from a given data file chunk by chunk
+     Input: file    --- data file name (see readDataBulk for the formats)
+            chunk   --- # of data points read at a time
+     Output: iterator of (<x array>, <y array>)
+    """
+#
+#--- binary files are memory-mapped and sliced
+#
+    if file.endswith('.npy'):
+        (x, y) = readDataBulk(file, mmap=True)
+        for k in range(0, len(x), chunk):
+            yield (numpy.array(x[k:k+chunk], dtype=float), numpy.array(y[k:k+chunk], dtype=float))
+        return
+#
+#--- ascii file: find the separator from a sample of the file
+#
+    with open(file, 'r') as f:
+        sep = sniffDelimiter(f.readlines(65536))
+        f.seek(0)
+        while True:
+            lines = list(itertools.islice(f, chunk))
+            if len(lines) == 0:
+                break
+#
+#--- skip a chunk without data quietly; if a line cannot be parsed, read the chunk
+#--- line by line as readDataBulk does (the bad lines are skipped)
+#
+            if all(line.strip() == '' or line.lstrip().startswith('#') for line in lines):
+                continue
+            try:
+                data = numpy.loadtxt(lines, delimiter=sep, comments='#', usecols=(0, 1), ndmin=2)
+            except (ValueError, IndexError):
+                (xorg, yorg) = parseDataLines(lines)
+                if len(xorg) == 0:
+                    continue
+                data = numpy.column_stack((xorg, yorg))
+
+            yield (data[:, 0], data[:, 1])
+
 #---------------------------------------------------------------------------------------
 #--  readData: read data from a given data file                                      ---
 #---------------------------------------------------------------------------------------
@@ -230,7 +686,22 @@ def readData(file):
      The values are converted into float.
     """
     with open(file, 'r') as f:
-        data = [line.strip() for line in f.readlines()]
+        data = f.readlines()
+
+    return parseDataLines(data)
+
+#---------------------------------------------------------------------------------------
+#--  parseDataLines: read two column data from a list of lines, line by line         ---
+#---------------------------------------------------------------------------------------
+
+def parseDataLines(data):
+    """
+     read two column data from a list of lines, line by line. 
+     Input: data    --- a list of lines (see readData for the format)
+     Output: (<x list>, <y list>)
+     Note: the lines which cannot be parsed are skipped
+    """
+    data = [line.strip() for line in data]
 #
 #--- check data and devide them into x and y
     xorg = []
@@ -270,6 +741,140 @@ def readData(file):
 
     return (xorg, yorg)
 
+#---------------------------------------------------------------------------------------
+#--  readDataBulk: read two column data from a given data file into float arrays     ---
+#---------------------------------------------------------------------------------------
+
+def readDataBulk(file, mmap=False, dtype='float64'):
+    """
+     read two column data from a given data file into float arrays in bulk
+     Input: file  --- data file name. the file can be:
+                        * ascii file with two columns separated by space (\t+, \s+),
+                          ",", ":", or ";". the separator is found once from
+                          the first data line
+                        * .npy file holding (n x 2) or (2 x n) array
+                        * other binary file holding (x, y) pairs of "dtype" if mmap=True
+            mmap  --- if True, a binary file is memory-mapped instead of read in
+            dtype --- data type of the output y array (or of the raw binary file).
+                      x is read as float64 so that time values keep their precision
+     Output: (<x array>, <y array>)
+     Note: lines starting with "#" (and the part of a line after "#") are skipped.
+           if the ascii file has a line which cannot be parsed, readData is used instead
+    """
+#
+#--- numpy binary file
+#
+    if file.endswith('.npy'):
+        if mmap:
+            data = numpy.load(file, mmap_mode='r')
+        else:
+            data = numpy.load(file)
+
+        if data.ndim == 2 and data.shape[1] != 2 and data.shape[0] == 2:
+            data = data.T
+
+        return (data[:, 0].astype(numpy.float64, copy=False), data[:, 1].astype(dtype, copy=False))
+#
+#--- raw binary file of (x, y) pairs
+#
+    if mmap:
+        data = numpy.memmap(file, dtype=dtype, mode='r').reshape(-1, 2)
+
+        return (data[:, 0].astype(numpy.float64), data[:, 1])
+#
+#--- ascii file: find the separator from a sample of the file
+#
+    with open(file, 'r') as f:
+        sample = f.readlines(65536)
+
+    sep = sniffDelimiter(sample)
+
+    try:
+        data = numpy.loadtxt(file, delimiter=sep, comments='#', usecols=(0, 1), ndmin=2)
+    except (ValueError, IndexError):
+        (xorg, yorg) = readData(file)
+
+        return (numpy.array(xorg, dtype=numpy.float64), numpy.array(yorg, dtype=dtype))
+
+    return (numpy.ascontiguousarray(data[:, 0]), data[:, 1].astype(dtype))
+
+#---------------------------------------------------------------------------------------
+#--  sniffDelimiter: find the separator used in the data lines                       ---
+#---------------------------------------------------------------------------------------
+
+def sniffDelimiter(sample):
+    """
+     find the separator used in the data lines
+     Input:  sample --- a list of lines read from the data file
+     Output: sep    --- ":", ",", ";" or None (white space)
+    """
+    for ent in sample:
+        ent = ent.strip()
+        if ent == '' or ent.startswith('#'):
+            continue
+
+        for sep in (':', ',', ';'):
+            if sep in ent:
+                return sep
+
+        return None
+
+    return None
+
+#---------------------------------------------------------------------------------------
+#--  findOutlierMask: find a boolean mask of the data points kept after outlier rejection
+#---------------------------------------------------------------------------------------
+
+def findOutlierMask(x, y, nodrop=0, tail=0.005, nsigma=3.0, chunk=0):
+    """
+    find a boolean mask of the data points kept after outlier rejection
+    Input:      x       --- independent value (array)
+                y       --- dependent value (array)
+                nodrop  --- indicator of how the outlyers will be handled
+                            0: only the sigma method is used (as it always has been)
+                            1: only the sigma method is used
+                            2: only the percentile cut is used (9 is the same)
+                            3: no data are dropped
+                tail    --- fraction of the data dropped at each end by the percentile cut
+                nsigma  --- the data above nsigma from a straight fitted line are dropped
+                chunk   --- if > 0, the line fit and the residuals are computed this many
+                            data at a time so that no temporary array of the full size
+                            is created (used by the compact mode)
+    Output:     mask    --- boolean array; True for the data to be kept. the same mask can
+                            be applied to any other column of the same length
+    """
+    if chunk > 0:
+        ax = numpy.asarray(x)
+        ay = numpy.asarray(y)
+    else:
+        ax = numpy.asarray(x, dtype=float)
+        ay = numpy.asarray(y, dtype=float)
+    mask = numpy.ones(len(ay), dtype=bool)
+#
+#--- residuals from a straight fitted line; the points above nsigma are dropped
+#
+    if (nodrop == 0 or nodrop == 1) and chunk > 0:
+        steps = range(0, len(ay), chunk)
+        (intercept, slope, std, ymin, ymax) \
+                = fitLineChunks((ax[k:k+chunk], ay[k:k+chunk]) for k in steps)
+        slimit = nsigma * std
+        for k in steps:
+            mask[k:k+chunk] &= (ay[k:k+chunk] - intercept - slope * ax[k:k+chunk]) <= slimit
+
+    elif nodrop == 0 or nodrop == 1:
+        (intercept, slope) = fit_poly(ax, ay, 2)
+        diff   = ay - intercept - slope * ax
+        slimit = nsigma * numpy.std(diff)
+        mask  &= diff <= slimit
+#
+#--- percentile cut at both ends
+#
+    if nodrop == 9 or nodrop == 2:
+        (blimit, tlimit) = findCutValues(ay, tail)
+        mask &= (ay >= blimit) & (ay <= tlimit)
+
+    return mask
+
 #---------------------------------------------------------------------------------------
 #--  findSlopeSigma: finds a standard deviation for the residuals from a fitted straight line
 #---------------------------------------------------------------------------------------
@@ -283,16 +888,8 @@ def findSlopeSigma(x, y, intercept, slope):
                 slope     --- slope of the fitted line
     Output:     std       --- standard deviation of the residuals from the fitted line
     """
-    sum1 = 0.0
-    sum2 = 0.0
-
-    for i in range(0, len(x)):
-        diff  = y[i] - intercept - slope * x[i]
-        sum1 += diff
-        sum2 += diff * diff
-
-    avg = float(sum1)/float(len(x))
-    std = math.sqrt(float(sum2) / float(len(x)) - avg * avg)
+    diff = numpy.asarray(y, dtype=float) - intercept - slope * numpy.asarray(x, dtype=float)
+    std  = float(numpy.std(diff))
 
     return std
 
@@ -300,20 +897,39 @@ def findSlopeSigma(x, y, intercept, slope):
 #--- findCutValues: finds the values of thetop and the bottom 0.5% of the data       ---
 #---------------------------------------------------------------------------------------
 
-def findCutValues(y):
+def findCutValues(y, tail=0.005):
     """
     finds the values of thetop and the bottom 0.5% of the data
     Input:      y            --- array
-    Output:     (ybot, ytop) --- bottom and top 0.5% values of the data
+                tail         --- fraction of the data to be cut at each end. default: 0.005
+                                 if it is a pair (bottom, top), each end uses its own fraction
+    Output:     (ybot, ytop) --- bottom and top cut values of the data
+    Note:       the values are found with a selection (numpy.partition) in linear time;
+                the data are not fully sorted
     """
-    temp = sorted(y)
-    nlim = int(0.005 * len(y))
+    if isinstance(tail, (list, tuple)):
+        (bfrac, tfrac) = tail
+    else:
+        bfrac = tail
+        tfrac = tail
 
-    ybot = y[nlim]
-    if nlim == 0:
-        ytop = y[-1]
+    ay   = numpy.asarray(y)
+    tot  = len(ay)
+    blim = int(bfrac * tot)
+    tlim = int(tfrac * tot)
+#
+#--- index of the bottom and the top cut values in the sorted order
+#
+    kbot = min(blim, tot - 1)
+    if tlim == 0:
+        ktop = tot - 1
     else:
-        ytop = y[len(y) - nlim]
+        ktop = max(tot - tlim, kbot)
+
+    temp = numpy.partition(ay, [kbot, ktop])
+
+    ybot = temp[kbot]
+    ytop = temp[ktop]
 
     return(ybot, ytop)
 
@@ -321,104 +937,416 @@ def findCutValues(y):
 #--- findMovingAvg: estimate moving average, top and bottom envelope                ----
 #---------------------------------------------------------------------------------------
 
-def findMovingAvg(xdata, ydata, arange):
+def findMovingAvg(xdata, ydata, arange, nproc = 1, envelope = (0, 100)):
     """
     estimate moving average, top and bottom envelope
     Input:      xdata --- independent variable (array)
                 ydata --- dependent variable (array)
                 arange--- the interval which you want to find an average
+                nproc --- # of processes used to bin the data. default: 1
+                envelope- percentiles used for min_sv and max_sv. default: (0, 100)
     Output:     xcent --- the mid value of the interval (independent value)
                 movavg--- the moving average of the period
                 sigma --- the standard deviation of the period
                 min_sv--- the min of the period
                 max_sv--- the max of the period
+    Note:       the periods start at the smallest x and periods without data are skipped
     """
-    xcent   = []
-    movavg  = []
-    sigma   = []
-    max_sv  = []
-    min_sv  = []
 #
 #--- initialize
 #
-    ax    = numpy.array(xdata)
-    ay    = numpy.array(ydata)
-    aind  = ax.argsort()
-    asx   = ax[aind[::1]]
-    asy   = ay[aind[::1]]
-    xdata = list(asx)
-    ydata = list(asy)
-    start = xdata[0]
-    end   = start + arange
-    sum1  = 0.0
-    sum2  = 0.0
-    smax  = -1.0e5
-    smin  =  1.0e5
-    mcnt  = 0
-
-    for i in range(0, len(xdata)):
-#
-#--- if the data value is in the range, just accumulate
-#
-        if xdata[i] >= start and xdata[i] < end:
-            sum1 += ydata[i]
-            sum2 += ydata[i] * ydata[i]
-            if ydata[i] > smax:
-                smax = ydata[i]
-            if ydata[i] < smin:
-                smin = ydata[i]
-            mcnt += 1
-
-        elif xdata[i] <= start:
-#
-#--- if the data value has not reached to the beginning value, skip
-#    
-            continue
+    ax    = numpy.asarray(xdata, dtype=float)
+    ay    = numpy.asarray(ydata, dtype=float)
+    if len(ax) == 0:
+        return ([], [], [], [], [])
 
-        elif xdata[i] >= end:
+    aind  = ax.argsort(kind='stable')
+    asx   = ax[aind]
+    asy   = ay[aind]
+    start = asx[0]
 #
-#--- if the data value is beyond the upper range, compute average
+#--- per period statistics
 #
-            if mcnt == 0:
+    if nproc > 1:
+        stats = findBinStatsParallel(asx, asy, arange, start, nproc)
+    else:
+        stats = findBinStats(asx, asy, arange, start)
 #
-#--- if there is no data, skip
+#--- replace min and max with the percentiles of each period
 #
-                while(xdata[i] >= end):
-                    start = end
-                    end   = start + arange
+    if tuple(envelope) != (0, 100):
+        (bidx, pval) = findBinPercentiles(asx, asy, arange, start, envelope)
+        stats = stats[:4] + (pval[:, 0], pval[:, 1])
 
-                sum1 += ydata[i]
-                sum2 += ydata[i] * ydata[i]
-                if ydata[i] > smax:
-                    smax = ydata[i]
-                if ydata[i] < smin:
-                    smin = ydata[i]
-                mcnt += 1
-            else:
-                avg = float(sum1) / float(mcnt)
-                try:
-                    std = math.sqrt(float(sum2) /float(mcnt) - avg * avg)
-                except:
-                    std = 0.0
-                movavg.append(avg)
-                sigma.append(std)
-                max_sv.append(smax)
-                min_sv.append(smin)
+    return binStatsToAvg(stats, start, arange)
+
+#---------------------------------------------------------------------------------------
+#--- findBinPercentiles: find percentiles of each period with a single sort         ----
+#---------------------------------------------------------------------------------------
+
+def findBinPercentiles(xdata, ydata, arange, start, plist = (2, 98)):
+    """
+    find percentiles of each period. the data are sorted only once by (period, value)
+    and the percentiles are picked by the index of each period segment. the values 
+    are linearly interpolated in the same way as numpy.percentile
+    Input:      xdata --- independent variable (numpy array)
+                ydata --- dependent variable (numpy array)
+                arange--- the interval of the period
+                start --- the beginning of the first period
+                plist --- a list of percentiles (0 - 100)
+    Output:     (bidx, pval)
+                bidx  --- the period index of each non-empty period
+                pval  --- (# of periods x len(plist)) array of the percentiles
+    """
+    if len(xdata) == 0:
+        return (numpy.zeros(0, dtype=numpy.int64), numpy.zeros((0, len(plist))))
+
+    bidx  = numpy.floor((xdata - start) / arange).astype(numpy.int64)
+    order = numpy.lexsort((ydata, bidx))
+    sbin  = bidx[order]
+    sval  = ydata[order]
 #
-#--- take the mid point of the range to x value
+#--- the first position and the size of each period segment
 #
-                midx = 0.5 * float(start + end)
-                xcent.append(midx)
-    
-                start = end
-                end   = start + arange
-                sum1  = 0.0
-                sum2  = 0.0
-                smax  = -1.0e5
-                smin  =  1.0e5
-                mcnt  = 0
+    pos   = numpy.concatenate(([0], numpy.flatnonzero(numpy.diff(sbin)) + 1))
+    cnt   = numpy.diff(numpy.append(pos, len(sval)))
+
+    pval  = numpy.zeros((len(pos), len(plist)))
+    for k in range(0, len(plist)):
+        rpos  = pos + (cnt - 1) * (plist[k] / 100.0)
+        lpos  = numpy.floor(rpos).astype(numpy.int64)
+        upos  = numpy.minimum(lpos + 1, pos + cnt - 1)
+        frac  = rpos - lpos
+        pval[:, k] = sval[lpos] + (sval[upos] - sval[lpos]) * frac
+
+    return (sbin[pos], pval)
+
+#---------------------------------------------------------------------------------------
+#--- compactMovingAvg: drop outlyers and estimate moving average piece by piece     ----
+#---------------------------------------------------------------------------------------
+
+def compactMovingAvg(xorg, yorg, arange, nodrop = 0, tail = 0.005, envelope = (0, 100),\
+                     compact = 'float32', chunk = 1000000):
+    """
+    drop outlyers and estimate moving average, top and bottom envelope without 
+    creating temporary arrays of the full data size. the data are processed in 
+    pieces of about "chunk" data split at period boundaries
+    Input:      xorg    --- independent variable (float64 numpy array)
+                yorg    --- dependent variable (numpy array)
+                arange  --- the interval which you want to find an average
+                nodrop  --- indicator of how the outlyers will be handled
+                tail    --- fraction of the data dropped at each end by the percentile cut
+                envelope--- percentiles used for min_sv and max_sv
+                compact --- 'float32' or 'float64'; the type of the output arrays
+                chunk   --- the size of the pieces
+    Output:     (xcent, movavg, sigma, min_sv, max_sv) in numpy arrays; see findMovingAvg
+    """
+    tot = len(xorg)
+#
+#--- the data must be sorted in x; check without a full size temporary array
+#
+    steps = range(0, tot, chunk)
+    for k in steps:
+        if numpy.any(numpy.diff(xorg[k:k+chunk+1]) < 0):
+            order = xorg.argsort(kind='stable')
+            xorg  = xorg[order]
+            yorg  = yorg[order]
+            del order
+            break
+#
+#--- drop outliers if nodrop option indicates so
+#
+    mask = findOutlierMask(xorg, yorg, nodrop, tail, chunk=chunk)
+    if not mask.any():
+        empty = numpy.zeros(0, dtype=compact)
+        return (numpy.zeros(0), empty, empty, empty, empty)
+
+    start  = xorg[numpy.argmax(mask)]
+    bounds = findBinBounds(xorg, arange, start, chunk)
+#
+#--- bin each piece; no period is shared by two pieces
+#
+    slist = []
+    plist = []
+    for k in range(0, len(bounds) - 1):
+        pmask = mask[bounds[k]:bounds[k+1]]
+        xdata = xorg[bounds[k]:bounds[k+1]][pmask]
+        ydata = yorg[bounds[k]:bounds[k+1]][pmask]
+
+        slist.append(findBinStats(xdata, ydata, arange, start))
+        if tuple(envelope) != (0, 100):
+            plist.append(findBinPercentiles(xdata, ydata, arange, start, envelope)[1])
+
+    stats = combineBinStats(slist)
+    if len(plist) > 0:
+        pval  = numpy.concatenate(plist)
+        stats = stats[:4] + (pval[:, 0], pval[:, 1])
+
+    return binStatsToAvg(stats, start, arange, compact)
+
+#---------------------------------------------------------------------------------------
+#--- findBinStatsParallel: compute the period statistics with a process pool        ----
+#---------------------------------------------------------------------------------------
+
+def findBinStatsParallel(xdata, ydata, arange, start, nproc = 4):
+    """
+    compute the period statistics with a process pool. the sorted data are split
+    into contiguous pieces at period boundaries so that no period is shared by two 
+    pieces, and the data are passed to the workers through shared memory
+    Input:      xdata --- independent variable (numpy array sorted in increasing order)
+                ydata --- dependent variable (numpy array)
+                arange--- the interval of the period
+                start --- the beginning of the first period
+                nproc --- # of processes
+    Output:     (bidx, cnt, sum1, sum2, smin, smax); the same as findBinStats
+    """
+    tot = len(xdata)
+    if tot == 0 or nproc < 2:
+        return findBinStats(xdata, ydata, arange, start)
+#
+#--- split points aligned to the period boundaries
+#
+    bounds = findBinBounds(xdata, arange, start, (tot + nproc - 1) // nproc)
+#
+#--- copy the data into shared memory
+#
+    shm_list = []
+    try:
+        names = []
+        for ent in (xdata, ydata):
+            shm  = shared_memory.SharedMemory(create=True, size=max(ent.nbytes, 1))
+            shm_list.append(shm)
+            sarr = numpy.ndarray(ent.shape, dtype=ent.dtype, buffer=shm.buf)
+            sarr[:] = ent
+            names.append(shm.name)
+
+        dtypes = (xdata.dtype.str, ydata.dtype.str)
+        tasks  = []
+        for k in range(0, len(bounds) - 1):
+            tasks.append((names[0], names[1], dtypes, tot, bounds[k], bounds[k+1], arange, start))
+
+        with multiprocessing.Pool(min(nproc, len(tasks))) as pool:
+            slist = pool.map(binStatsShard, tasks)
+    finally:
+        for shm in shm_list:
+            shm.close()
+            shm.unlink()
 
-    return (xcent, movavg, sigma, min_sv, max_sv) 
+    return combineBinStats(slist)
+
+#---------------------------------------------------------------------------------------
+#--- findBinBounds: split sorted data into pieces at period boundaries              ----
+#---------------------------------------------------------------------------------------
+
+def findBinBounds(xdata, arange, start, step):
+    """
+    split sorted data into pieces of about "step" data at period boundaries so that
+    no period is shared by two pieces
+    Input:      xdata --- independent variable (numpy array sorted in increasing order)
+                arange--- the interval of the period
+                start --- the beginning of the first period
+                step  --- the target # of data in a piece
+    Output:     bounds--- a list of the positions [0, ..., len(xdata)]; the piece k is
+                          xdata[bounds[k]:bounds[k+1]]
+    """
+    tot  = len(xdata)
+    step = max(int(step), 1)
+
+    def bin_index(val):
+        return math.floor((val - start) / arange)
+
+    bounds = [0]
+    pos    = step
+    while pos < tot:
+        bnd = bisect.bisect_right(xdata, bin_index(xdata[pos]), lo=pos, key=bin_index)
+        if bnd >= tot:
+            break
+        bounds.append(bnd)
+        pos = bnd + step
+    bounds.append(tot)
+
+    return bounds
+
+#---------------------------------------------------------------------------------------
+#--- binStatsShard: compute the period statistics of a piece in shared memory       ----
+#---------------------------------------------------------------------------------------
+
+def binStatsShard(task):
+    """
+    compute the period statistics of a piece of the data held in shared memory.
+    this is run in a worker process of findBinStatsParallel
+    Input:      task  --- (xname, yname, dtypes, tot, lo, hi, arange, start)
+                          xname, yname --- names of the shared memory blocks
+                          dtypes       --- (x dtype, y dtype) of the data in the blocks
+                          tot          --- # of data in the blocks
+                          lo, hi       --- the range of the piece
+                          arange       --- the interval of the period
+                          start        --- the beginning of the first period
+    Output:     (bidx, cnt, sum1, sum2, smin, smax) of the piece; see findBinStats
+    """
+    (xname, yname, dtypes, tot, lo, hi, arange, start) = task
+
+    xshm = shared_memory.SharedMemory(name=xname)
+    yshm = shared_memory.SharedMemory(name=yname)
+    try:
+        xdata = numpy.ndarray((tot,), dtype=dtypes[0], buffer=xshm.buf)
+        ydata = numpy.ndarray((tot,), dtype=dtypes[1], buffer=yshm.buf)
+        stats = findBinStats(xdata[lo:hi], ydata[lo:hi], arange, start)
+        del xdata, ydata
+    finally:
+        xshm.close()
+        yshm.close()
+
+    return stats
+
+#---------------------------------------------------------------------------------------
+#--- findBinStats: compute the sufficient statistics of each period                 ----
+#---------------------------------------------------------------------------------------
+
+def findBinStats(xdata, ydata, arange, start):
+    """
+    compute the sufficient statistics of each period. the period k covers
+    start + k * arange <= x < start + (k+1) * arange
+    Input:      xdata --- independent variable (numpy array sorted in increasing order)
+                ydata --- dependent variable (numpy array)
+                arange--- the interval of the period
+                start --- the beginning of the first period
+    Output:     (bidx, cnt, sum1, sum2, smin, smax)
+                bidx  --- the period index of each non-empty period
+                cnt   --- # of data in the period
+                sum1  --- sum of the data
+                sum2  --- sum of the square of the data
+                smin  --- min of the data
+                smax  --- max of the data
+    """
+    if len(xdata) == 0:
+        empty = numpy.zeros(0)
+        return (numpy.zeros(0, dtype=numpy.int64), numpy.zeros(0, dtype=numpy.int64), empty, empty, empty, empty)
+
+    bidx = numpy.floor((xdata - start) / arange).astype(numpy.int64)
+#
+#--- positions where a new period starts
+#
+    pos  = numpy.concatenate(([0], numpy.flatnonzero(numpy.diff(bidx)) + 1))
+    cnt  = numpy.diff(numpy.append(pos, len(xdata)))
+    yd64 = ydata.astype(numpy.float64, copy=False)
+    sum1 = numpy.add.reduceat(yd64, pos)
+    sum2 = numpy.add.reduceat(yd64 * yd64, pos)
+    smin = numpy.minimum.reduceat(ydata, pos)
+    smax = numpy.maximum.reduceat(ydata, pos)
+
+    return (bidx[pos], cnt, sum1, sum2, smin, smax)
+
+#---------------------------------------------------------------------------------------
+#--- combineBinStats: combine period statistics computed from separated data pieces ---
+#---------------------------------------------------------------------------------------
+
+def combineBinStats(slist):
+    """
+    combine period statistics computed from separated data pieces
+    Input:      slist --- a list of the outputs of findBinStats (in the order of x)
+                          computed with the same start and arange
+    Output:     (bidx, cnt, sum1, sum2, smin, smax) --- see findBinStats
+    """
+    (bidx, cnt, sum1, sum2, smin, smax) = [numpy.concatenate(ent) for ent in zip(*slist)]
+    if len(bidx) == 0:
+        return (bidx, cnt, sum1, sum2, smin, smax)
+#
+#--- periods which are split between two pieces are merged
+#
+    pos = numpy.concatenate(([0], numpy.flatnonzero(numpy.diff(bidx)) + 1))
+    if len(pos) == len(bidx):
+        return (bidx, cnt, sum1, sum2, smin, smax)
+
+    return (bidx[pos], numpy.add.reduceat(cnt, pos), numpy.add.reduceat(sum1, pos),\
+            numpy.add.reduceat(sum2, pos), numpy.minimum.reduceat(smin, pos),\
+            numpy.maximum.reduceat(smax, pos))
+
+#---------------------------------------------------------------------------------------
+#--- coarsenBinStats: merge every "factor" consecutive periods into one              ---
+#---------------------------------------------------------------------------------------
+
+def coarsenBinStats(stats, factor):
+    """
+    merge every "factor" consecutive periods into one
+    Input:      stats  --- (bidx, cnt, sum1, sum2, smin, smax); see findBinStats
+                factor --- # of periods to be merged (integer)
+    Output:     (bidx, cnt, sum1, sum2, smin, smax) of the periods "factor" times wider
+    """
+    (bidx, cnt, sum1, sum2, smin, smax) = stats
+    if factor == 1 or len(bidx) == 0:
+        return stats
+
+    nidx = bidx // factor
+
+    return combineBinStats([(nidx, cnt, sum1, sum2, smin, smax)])
+
+#---------------------------------------------------------------------------------------
+#--- binStatsToAvg: convert period statistics into moving average and envelopes     ---
+#---------------------------------------------------------------------------------------
+
+def binStatsToAvg(stats, start, arange, compact = ''):
+    """
+    convert period statistics into moving average and envelopes
+    Input:      stats   --- (bidx, cnt, sum1, sum2, smin, smax); see findBinStats
+                start   --- the beginning of the first period
+                arange  --- the interval of the period
+                compact --- if 'float32' or 'float64', numpy arrays of the type are 
+                            returned (xcent is always float64). otherwise lists
+    Output:     (xcent, movavg, sigma, min_sv, max_sv); see findMovingAvg
+    """
+    (bidx, cnt, sum1, sum2, smin, smax) = stats
+
+    xcent  = start + (bidx + 0.5) * arange
+    movavg = sum1 / cnt
+    sigma  = numpy.sqrt(numpy.maximum(sum2 / cnt - movavg * movavg, 0.0))
+
+    if compact != '':
+        return (xcent, movavg.astype(compact), sigma.astype(compact),\
+                smin.astype(compact), smax.astype(compact))
+
+    return (xcent.tolist(), movavg.tolist(), sigma.tolist(), smin.tolist(), smax.tolist())
+
+#---------------------------------------------------------------------------------------
+#--- fitEnvelopes: fit polynomials to moving average, envelopes and std             ---
+#---------------------------------------------------------------------------------------
+
+def fitEnvelopes(xcent, movavg, sigma, min_sv, max_sv, nterms, compact = ''):
+    """
+    fit n-th degree polynomials to moving average, envelopes and std. the design 
+    matrix is factorized only once
+    Input:      xcent, movavg, sigma, min_sv, max_sv --- see findMovingAvg
+                nterms  --- a degree of polynomial fitting. if 0, no fitting is done
+                compact --- if 'float32' or 'float64', numpy arrays of the type are 
+                            returned. otherwise lists
+    Output:     (y_avg, y_min, y_max, y_sig) --- the fitted values; zeros if nterms == 0
+    """
+    if compact != '':
+        if nterms > 0 and len(xcent) > 0:
+            acoeff = fit_poly_multi(xcent, [movavg, min_sv, max_sv, sigma], nterms)
+            yest   = estimatepolyfit(xcent, acoeff).astype(compact)
+        else:
+            yest   = numpy.zeros((len(xcent), 4), dtype=compact)
+#
+#--- make each column contiguous
+#
+        return tuple([numpy.ascontiguousarray(yest[:, k]) for k in range(0, 4)])
+
+    if nterms > 0 and len(xcent) > 0:
+        acoeff = fit_poly_multi(xcent, [movavg, min_sv, max_sv, sigma], nterms)
+        yest   = estimatepolyfit(xcent, acoeff)
+        y_avg  = yest[:, 0].tolist()
+        y_min  = yest[:, 1].tolist()
+        y_max  = yest[:, 2].tolist()
+        y_sig  = yest[:, 3].tolist()
+    else:
+        xcnt  = len(xcent)
+        y_avg = [0.0] * xcnt
+        y_min = [0.0] * xcnt
+        y_max = [0.0] * xcnt
+        y_sig = [0.0] * xcnt
+
+    return (y_avg, y_min, y_max, y_sig)
 
 #---------------------------------------------------------------------------------------
 #--- estimatepolyfit: compute polynomial fit value for given parameter sets          ---
@@ -426,20 +1354,22 @@ def findMovingAvg(xdata, ydata, arange):
 
 def estimatepolyfit(x, acoeff):
     """
-    compute polynomial fit value for given parameter sets
+    compute polynomial fit value for given parameter sets (Horner's rule)
     Input:      x      ---   independent variable array
-                acoeff --- array of polynomial coefficients
-    Output:     yest   --- the estimated fitted values (array)
+                acoeff --- array of polynomial coefficients. if it is 2D
+                           (nterms x k), k fits are evaluated at once
+    Output:     yest   --- the estimated fitted values (array). if acoeff is 2D,
+                           the shape is (len(x) x k)
     """
-    numcoeff = len(acoeff)
+    ax     = numpy.asarray(x, dtype=float)
+    acoeff = numpy.asarray(acoeff, dtype=float)
 
-    yest = []
-    for i in range(0, len(x)):
-        yval = 0
-        for j in range(0, numcoeff):
-            yval = yval + acoeff[j] *  x[i] ** j
+    if acoeff.ndim > 1:
+        ax = ax[:, numpy.newaxis]
 
-        yest.append(yval)
+    yest = numpy.zeros(ax.shape[:1] + acoeff.shape[1:])
+    for coeff in acoeff[::-1]:
+        yest = yest * ax + coeff
 
     return yest
 
@@ -467,6 +1397,37 @@ def fit_poly(x, y, nterms):
 
     return p_list
 
+#---------------------------------------------------------------------------------------
+#-- fit_poly_multi: estimate polynomial coefficients for several data sets at once   ---
+#---------------------------------------------------------------------------------------
+
+def fit_poly_multi(x, ylist, nterms):
+    """
+    estimate polynomial fitting coefficients for several dependent data sets which
+    share the same independent variable. the design matrix is built and factorized
+    only once and all data sets are solved as multiple right hand sides
+    Input:      x      --- independent variable (array)
+                ylist  --- a list of dependent variable arrays
+                nterms --- degree of polynomial fit
+    Output:     acoeff --- array of polynomial fit coefficients (nterms x len(ylist));
+                           acoeff[:, k] is the fit for ylist[k]
+    """
+    d   = numpy.asarray(x, dtype=float)
+    rhs = numpy.array(ylist, dtype=float).T
+#
+#--- vandermonde matrix; scale the columns as poly.polyfit does to keep it well conditioned
+#
+    lhs   = poly.polyvander(d, nterms-1)
+    scl   = numpy.sqrt(numpy.square(lhs).sum(axis=0))
+    scl[scl == 0] = 1.0
+#
+#--- one factorization for all right hand sides
+#
+    (acoeff, resids, rank, sval) = numpy.linalg.lstsq(lhs / scl, rhs, rcond=len(d) * numpy.finfo(float).eps)
+    acoeff = (acoeff.T / scl).T
+
+    return acoeff
+
 #---------------------------------------------------------------------------------------
 #--- residuals: compute residuals                                                    ---
 #---------------------------------------------------------------------------------------
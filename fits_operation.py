@@ -16,34 +16,42 @@ import re
 import string
 import random
 import operator
+import warnings
 import math
+import fnmatch
+import gzip
+import sqlite3
 import numpy
 import astropy.io.fits  as pyfits
+from concurrent.futures import ThreadPoolExecutor
 
 sys.path.append('/data/mta4/Script/Python3.11/MTA')
 #
+#--- headers read so far: {(file name, extension): (mtime, header)}; see readHeader
+#
+header_cache      = {}
+header_cache_size = 10000
+#
+#--- comparison operators of the conditions; see tableFilterMask
+#
+compare_ops = {'==': operator.eq, '!=': operator.ne, '<': operator.lt, 
+               '<=': operator.le, '>': operator.gt, '>=': operator.ge}
 
 #-------------------------------------------------------------------------------------------------------
 #-- findKeyWords: for a given fits file name, return a list of keyword lists and their values         --
 #-------------------------------------------------------------------------------------------------------
 
-def findKeyWords(ifile):
+def findKeyWords(ifile, extent=1):
     """
     for a given fits file name, return a list of keyword lists and their values
     Input:      ifile       -- fits file name
+                extent      -- extension #. default = 1
     Oputput:    klist       -- a list of keywords
                 val_list    -- value of the keywords
     """
-    flist = pyfits.open(ifile)
-    flist.close()
-
-    fhead = flist[1].header
-    klist = list(fhead.keys())
-
-    val_list = []
-    for i in range(0, len(klist)):
-        val = flist[0].header[klist[i]]
-        val_list.append(val)
+    fhead    = readHeader(ifile, extent)
+    klist    = list(fhead.keys())
+    val_list = list(fhead.values())
 
     return [klist, val_list]
 
@@ -51,20 +59,220 @@ def findKeyWords(ifile):
 #-- readHeaderLine: for a given fits file name and header keyword, return the value for the keyword ----
 #-------------------------------------------------------------------------------------------------------
 
-def readHeaderLine(ifile, kname):
+def readHeaderLine(ifile, kname, extent=0):
     """
     for a given fits file name and header keyword, return the value for the keyword
     Input:      ifile -- fits file name
                 name  -- keyword
+                extent-- extension #. default = 0
     Output:     val   -- keyward value
     """
-    flist = pyfits.open(ifile)
-    flist.close()
-
-    val   = flist[0].header[kname]
+    val   = readHeader(ifile, extent)[kname]
 
     return val
 
+#-------------------------------------------------------------------------------------------------------
+#-- readHeader: read a header of a fits file without reading the data                                 --
+#-------------------------------------------------------------------------------------------------------
+
+def readHeader(ifile, extent=0):
+    """
+    read a header of a fits file without reading the data. the file is read only up to
+    the end of the header of the extension and the data parts are skipped. the headers
+    are kept in header_cache and read again only if the file is modified
+    Input:      ifile   -- fits file name
+                extent  -- extension #. default = 0
+    Output:     header  -- header of the extension. this is the cached object; copy it
+                           before modifying
+    """
+    key   = (os.path.abspath(ifile), extent)
+    mtime = os.stat(ifile).st_mtime_ns
+
+    ent = header_cache.pop(key, None)
+    if ent is not None and ent[0] == mtime:
+        header = ent[1]
+    else:
+        header = pyfits.getheader(ifile, extent)
+#
+#--- keep the most recently used headers at the end; drop the oldest if it is full
+#
+    header_cache[key] = (mtime, header)
+    if len(header_cache) > header_cache_size:
+        del header_cache[next(iter(header_cache))]
+
+    return header
+
+#-------------------------------------------------------------------------------------------------------
+#-- read_headers: read keyword values from many fits files and return them in a table                 --
+#-------------------------------------------------------------------------------------------------------
+
+def read_headers(files, keywords, extent=0):
+    """
+    read keyword values from many fits files and return them in a table
+    Input:      files    -- a list of fits file names
+                keywords -- a list of keywords
+                extent   -- extension #. default = 0
+    Output:     table    -- astropy Table with a column 'file' and a column for each keyword.
+                            the value is masked if the keyword (or the file) is not found
+    """
+    from astropy.table import Table, MaskedColumn
+
+    rows = []
+    for ifile in files:
+        try:
+            fhead = readHeader(ifile, extent)
+        except (OSError, IndexError):
+            fhead = {}
+
+        rows.append([fhead.get(key) for key in keywords])
+
+    table = Table()
+    table['file'] = list(files)
+    for k in range(0, len(keywords)):
+        vals = [row[k] for row in rows]
+        mask = [val is None for val in vals]
+        if any(mask):
+#
+#--- fill the missing entries with a value of the same type as the others
+#
+            good = [val for val in vals if val is not None]
+            if len(good) == 0:
+                fill = ''
+            elif isinstance(good[0], str):
+                fill = ''
+            else:
+                fill = type(good[0])(0)
+            vals = [fill if val is None else val for val in vals]
+            table[keywords[k]] = MaskedColumn(vals, mask=mask)
+        else:
+            table[keywords[k]] = vals
+
+    return table
+
+#-------------------------------------------------------------------------------------------------------
+#-- indexFitsHeaders: store header keyword values of fits files in a directory tree in a database     --
+#-------------------------------------------------------------------------------------------------------
+
+def indexFitsHeaders(top, dbfile, keywords, extent=0, pattern='*.fits*', nthread=8):
+    """
+    store header keyword values of fits files in a directory tree in a sqlite database.
+    only new or modified (by mtime) files are read and the files removed from the tree
+    are removed from the database. if the keyword list changes, all files are read again
+    Input:      top      -- top directory of the tree
+                dbfile   -- sqlite database file name
+                keywords -- a list of keywords to be stored
+                extent   -- extension # of the header. default = 0
+                pattern  -- file name pattern. default = '*.fits*'
+                nthread  -- # of threads to read the headers. default = 8
+    Output:     dbfile   -- updated database
+                nread    -- # of the files read
+    """
+    db = sqlite3.connect(dbfile)
+    db.execute('CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)')
+    db.execute('CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, mtime INTEGER)')
+    db.execute('CREATE TABLE IF NOT EXISTS keywords (path TEXT, keyword TEXT, value)')
+    db.execute('CREATE INDEX IF NOT EXISTS keyword_value ON keywords (keyword, value)')
+    db.execute('CREATE INDEX IF NOT EXISTS keyword_path ON keywords (path)')
+#
+#--- if the keyword list or the extension is changed, start over
+#
+    klist = ' '.join(keywords) + ' ext=' + str(extent)
+    row   = db.execute("SELECT value FROM meta WHERE name = 'keywords'").fetchone()
+    if row is None or row[0] != klist:
+        db.execute('DELETE FROM files')
+        db.execute('DELETE FROM keywords')
+        db.execute("INSERT OR REPLACE INTO meta VALUES ('keywords', ?)", (klist,))
+#
+#--- find new and modified files
+#
+    known = dict(db.execute('SELECT path, mtime FROM files'))
+    found = {}
+    for dpath, dnames, fnames in os.walk(top):
+        for fname in fnmatch.filter(fnames, pattern):
+            path = os.path.abspath(os.path.join(dpath, fname))
+            try:
+                found[path] = os.stat(path).st_mtime_ns
+            except OSError:
+                continue
+
+    gone  = [path for path in known if path not in found]
+    todo  = [path for path in found if known.get(path) != found[path]]
+
+    for path in gone + todo:
+        db.execute('DELETE FROM keywords WHERE path = ?', (path,))
+        db.execute('DELETE FROM files WHERE path = ?', (path,))
+#
+#--- read the headers with threads (reading and decompressing do not hold the GIL)
+#
+    def read_one(path):
+        try:
+            fhead = pyfits.getheader(path, extent)
+        except (OSError, IndexError):
+            return []
+
+        out = []
+        for key in keywords:
+            if key in fhead:
+                val = fhead[key]
+                if isinstance(val, (bool, numpy.bool_)):
+                    val = int(val)
+                elif not isinstance(val, (int, float, str)):
+                    val = str(val)
+                out.append((path, key, val))
+        return out
+
+    with ThreadPoolExecutor(max_workers=nthread) as pool:
+        for path, rows in zip(todo, pool.map(read_one, todo)):
+            db.executemany('INSERT INTO keywords VALUES (?, ?, ?)', rows)
+            db.execute('INSERT INTO files VALUES (?, ?)', (path, found[path]))
+
+    db.commit()
+    db.close()
+
+    return len(todo)
+
+#-------------------------------------------------------------------------------------------------------
+#-- queryFitsIndex: find fits files in the header keyword database which match the conditions        ---
+#-------------------------------------------------------------------------------------------------------
+
+def queryFitsIndex(dbfile, conditions):
+    """
+    find fits files in the header keyword database (see indexFitsHeaders) which match 
+    all the conditions
+    Input:      dbfile      -- sqlite database file name
+                conditions  -- a dictionary of keyword: condition. the condition is
+                               a value:             keyword == value
+                               (start, stop):       start <= keyword <= stop; either 
+                                                    can be None (no limit)
+                               e.g. {'OBSID': 1234, 'DATE-OBS': ('2024-01-01', None)}
+    Output:     a sorted list of the file paths
+    """
+    query = []
+    args  = []
+    for key, cond in conditions.items():
+        if isinstance(cond, (list, tuple)):
+            line = 'SELECT path FROM keywords WHERE keyword = ?'
+            args.append(key)
+            if cond[0] is not None:
+                line += ' AND value >= ?'
+                args.append(cond[0])
+            if cond[1] is not None:
+                line += ' AND value <= ?'
+                args.append(cond[1])
+        else:
+            line = 'SELECT path FROM keywords WHERE keyword = ? AND value = ?'
+            args += [key, cond]
+        query.append(line)
+
+    if len(query) == 0:
+        query = ['SELECT path FROM files']
+
+    db    = sqlite3.connect(dbfile)
+    paths = [row[0] for row in db.execute(' INTERSECT '.join(query) + ' ORDER BY path', args)]
+    db.close()
+
+    return paths
+
 #-------------------------------------------------------------------------------------------------------
 #-- findTableCols: find column names of table fits data                                              ---
 #-------------------------------------------------------------------------------------------------------
@@ -85,17 +293,36 @@ def findTableCols(ifile, extent=1):
 #-- findTableData: extract a table data from a given fits file                                       ---
 #-------------------------------------------------------------------------------------------------------
 
-def findTableData(ifile, col= 'NA', extent=1):
+def findTableData(ifile, col= 'NA', extent=1, rows=None, trange=None, tcol='time', chunk=100000):
     """
     extract a table data from a given fits file
     Input:      ifile   -- fits file name
                 col     -- column name. if it is not given, print out all data
                            this can be a list of column names or a single column name
+                extent  -- extension #. default = 1
+                rows    -- (start, stop) row range. default: None (all rows)
+                trange  -- (tstart, tstop) time window; rows with tstart <= tcol < tstop.
+                           tcol must be in increasing order. default: None
+                tcol    -- name of the time column. default = 'time'
+                chunk   -- # of rows read at once from a gzipped file
     Output:     fdata   -- table data or a list of table data
+    Note:       an uncompressed file is memory-mapped and only the selected rows of the
+                requested columns are converted. a gzipped file is decompressed in chunks
+                of rows, up to the last selected row, and only the requested columns of 
+                the selected rows are kept
     """
+    if isGzipped(ifile) and (col != 'NA' or rows is not None or trange is not None):
+        return readTableStream(ifile, col, extent, rows, trange, tcol, chunk)
+
     flist = pyfits.open(ifile)
     fdata = flist[extent].data
     flist.close()
+#
+#--- select the rows before touching the columns
+#
+    (r0, r1) = findRowRange(fdata, rows, trange, tcol)
+    if (r0 > 0) or (r1 < len(fdata)):
+        fdata = fdata[r0:r1]
     
     if col != 'NA':
         if isinstance(col, (list, tuple)):
@@ -110,6 +337,165 @@ def findTableData(ifile, col= 'NA', extent=1):
     else:
         return fdata
 
+#-------------------------------------------------------------------------------------------------------
+#-- findRowRange: find the row range of table data for a given row range and time window             ---
+#-------------------------------------------------------------------------------------------------------
+
+def findRowRange(fdata, rows=None, trange=None, tcol='time'):
+    """
+    find the row range of table data for a given row range and time window
+    Input:      fdata   -- table data
+                rows    -- (start, stop) row range or None
+                trange  -- (tstart, tstop) time window or None
+                tcol    -- name of the time column (in increasing order)
+    Output:     (r0, r1)-- selected rows of fdata are r0 <= row < r1
+    """
+    nrow = len(fdata)
+    r0   = 0
+    r1   = nrow
+    if rows is not None:
+        r0 = min(max(rows[0], 0), nrow)
+        r1 = min(max(rows[1], r0), nrow)
+
+    if trange is not None:
+        tdata = fdata[tcol]
+        r0    = max(r0, int(numpy.searchsorted(tdata, trange[0], side='left')))
+        r1    = min(r1, int(numpy.searchsorted(tdata, trange[1], side='left')))
+        r1    = max(r0, r1)
+
+    return (r0, r1)
+
+#-------------------------------------------------------------------------------------------------------
+#-- readTableStream: read selected columns and rows of a gzipped table fits file in chunks           ---
+#-------------------------------------------------------------------------------------------------------
+
+def readTableStream(ifile, col='NA', extent=1, rows=None, trange=None, tcol='time', chunk=100000):
+    """
+    read selected columns and rows of a gzipped table fits file in chunks. see findTableData
+    Input:      ifile   -- gzipped fits file name
+                col     -- column name, a list of column names, or 'NA' (all)
+                extent  -- extension #
+                rows    -- (start, stop) row range or None
+                trange  -- (tstart, tstop) time window or None
+                tcol    -- name of the time column (in increasing order)
+                chunk   -- # of rows read at once
+    Output:     fdata   -- table data or a list of table data
+    """
+    with pyfits.open(ifile) as flist:
+        hdu    = flist[extent]
+        header = hdu.header.copy()
+        cnames = hdu.columns.names
+        start  = hdu.fileinfo()['datLoc']
+#
+#--- variable length arrays are in the heap after the rows; read the whole table
+#
+    if header.get('PCOUNT', 0) > 0:
+        flist = pyfits.open(ifile)
+        fdata = flist[extent].data
+        flist.close()
+        (r0, r1) = findRowRange(fdata, rows, trange, tcol)
+        fdata    = fdata[r0:r1]
+        if col == 'NA':
+            return fdata
+        elif isinstance(col, (list, tuple)):
+            return [fdata[ent] for ent in col]
+        else:
+            return fdata[col]
+
+    if col == 'NA':
+        names = cnames
+    elif isinstance(col, (list, tuple)):
+        names = list(col)
+    else:
+        names = [col]
+
+    width = header['NAXIS1']
+    nrow  = header['NAXIS2']
+    r0    = 0
+    r1    = nrow
+    if rows is not None:
+        r0 = min(max(rows[0], 0), nrow)
+        r1 = min(max(rows[1], r0), nrow)
+#
+#--- decompress the rows chunk by chunk and keep the selected part of each chunk: the raw
+#--- bytes of the rows for the whole table, or the requested columns
+#
+    rlist = []
+    save  = {}
+    for name in names:
+        save[name] = []
+
+    with gzip.open(ifile, 'rb') as fo:
+        fo.seek(start + r0 * width)
+        pos = r0
+        while pos < r1:
+            raw = fo.read(min(chunk, r1 - pos) * width)
+            cnt = len(raw) // width
+            if cnt == 0:
+                break
+            raw  = raw[:cnt * width]
+            pos += cnt
+
+            if col == 'NA' and trange is None:
+                rlist.append(raw)
+                continue
+
+            header['NAXIS2'] = cnt
+            part = pyfits.BinTableHDU.fromstring(header.tostring().encode('ascii') + raw, uint=True).data
+
+            (p0, p1) = findRowRange(part, None, trange, tcol)
+            if col == 'NA':
+                rlist.append(raw[p0 * width:p1 * width])
+            else:
+                for name in names:
+                    save[name].append(numpy.array(part[name][p0:p1]))
+#
+#--- the time column is in increasing order; no more rows after the window
+#
+            if p1 < cnt:
+                break
+#
+#--- decode the raw rows once as a table; the columns keep their scaling and formats
+#
+    if col == 'NA':
+        raw = b''.join(rlist)
+        header['NAXIS2'] = len(raw) // width
+        return pyfits.BinTableHDU.fromstring(header.tostring().encode('ascii') + raw, uint=True).data
+
+    out = []
+    for name in names:
+        if len(save[name]) == 0:
+#
+#--- nothing is selected: a row of zero bytes gives zero length arrays of the right types
+#
+            header['NAXIS2'] = 1
+            dummy = pyfits.BinTableHDU.fromstring(header.tostring().encode('ascii') + bytes(width), uint=True).data
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore')
+                save[name].append(numpy.array(dummy[name])[:0])
+
+        out.append(numpy.concatenate(save[name]))
+
+    if isinstance(col, (list, tuple)):
+        return out
+    else:
+        return out[0]
+
+#-------------------------------------------------------------------------------------------------------
+#-- isGzipped: check whether a file is gzipped                                                       ---
+#-------------------------------------------------------------------------------------------------------
+
+def isGzipped(ifile):
+    """
+    check whether a file is gzipped
+    Input:      ifile   -- file name
+    Output:     True if the file starts with the gzip magic number
+    """
+    with open(ifile, 'rb') as fo:
+        head = fo.read(2)
+
+    return head == b'\x1f\x8b'
+
 #-------------------------------------------------------------------------------------------------------
 #-- appendFitsTable: Appending one table fits file to the another                                    ---
 #-------------------------------------------------------------------------------------------------------
@@ -123,31 +509,69 @@ def appendFitsTable(file1, file2, outname, extension = 1):
                 outname --- the name of the new fits file
     Output:     a new fits file "outname"
     """
-    t1 = pyfits.open(file1)
-    t2 = pyfits.open(file2)
+    appendFitsTables([file1, file2], outname, extension=extension)
+
+#-------------------------------------------------------------------------------------------------------
+#-- appendFitsTables: concatenate many table fits files                                              ---
+#-------------------------------------------------------------------------------------------------------
+
+def appendFitsTables(files, outname, extension = 1, sortkey = '', dedup = False):
+    """
+    concatenate many table fits files. the numbers of rows are read from the headers and
+    the output table is created once; the data of each file are copied into it column 
+    by column, one file at a time
+    the output table will inherit column attributes of the first fits table
+    Input:      files   --- a list of fits tables
+                outname --- the name of the new fits file
+                extension-- extension #. default = 1
+                sortkey --- if given, the rows are sorted by this column (stable)
+                dedup   --- if True, only the first row of each value of sortkey is kept.
+                            it needs sortkey
+    Output:     a new fits file "outname"
+    """
+    if dedup and sortkey == '':
+        raise ValueError('appendFitsTables: dedup needs sortkey')
 #
-#-- find numbers of rows (two different ways as examples here)
+#--- find numbers of rows from the headers
 #
-    nrow1 = t1[extension].data.shape[0]
-    nrow2 = t2[extension].header['naxis2']
+    nlist = []
+    for ifile in files:
+        nlist.append(readHeader(ifile, extension)['NAXIS2'])
 #
 #--- total numbers of rows to be created
 #
-    nrows = nrow1 + nrow2
+    nrows = sum(nlist)
+    t1    = pyfits.open(files[0])
     hdu   = pyfits.BinTableHDU.from_columns(t1[extension].columns, nrows=nrows)
+    names = t1[extension].columns.names
+    t1.close()
 #
-#--- append by the field names
+#--- copy each file by the field names
 #
-    for name in t1[extension].columns.names:
-        hdu.data.field(name)[nrow1:] = t2[extension].data.field(name)
+    pos = nlist[0]
+    for ifile, nrow in zip(files[1:], nlist[1:]):
+        t2 = pyfits.open(ifile)
+        tdata = t2[extension].data
+        for name in names:
+            hdu.data.field(name)[pos:pos+nrow] = tdata.field(name)
+        t2.close()
+        pos += nrow
+#
+#--- sort and/or remove duplicated rows
+#
+    if sortkey != '':
+        key = hdu.data.field(sortkey)
+        if dedup:
+            (uval, index) = numpy.unique(key, return_index=True)
+        else:
+            index = numpy.argsort(key, kind='stable')
+
+        hdu = pyfits.BinTableHDU(hdu.data[index], hdu.header)
 #
 #--- write new fits data file
 #
     hdu.writeto(outname)
 
-    t1.close()
-    t2.close()
-
 #-------------------------------------------------------------------------------------------------------
 #-- addTwoImages: combine two image files                                                            ---
 #-------------------------------------------------------------------------------------------------------
@@ -197,72 +621,171 @@ def selectTableData(ifile, colname, condition, outname, extension = 1, clobber='
                             if the selection is the interval, the format is in <start>:<stop>
                             if it is equal use: ==<value>
                             if it is not equal: !=<value>
+                            for a logical array column, ==<mask> (e.g. ==x10x1, see 
+                            select_data_with_logical_mask)
                 outname  --- output file name
                 clobber  --- overwrite the file if exists. if not given, 'no'
+    Note:       see filterTableData for compound conditions
     """
-    m1 = re.search('y', clobber)
-    m2 = re.search('Y', clobber)
-
-    if (m1 is not None) or (m2 is not None):
-        if os.path.isfile(outname):
-            os.remove(outname)
-
     t     = pyfits.open(ifile)
-    tdata = t[extension].data
-    
+    cform = t[extension].columns[colname].format
+    t.close()
+
     mc    = re.search(':',  condition)
     mc1   = re.search('\!', condition)
-    chk   = 0
     if mc is not None:
         atemp = re.split(':', condition)
         start = float(atemp[0])
         stop  = float(atemp[1])
-    
-        mask  = tdata.field(colname) >= start
-        modt  = tdata[mask]
-        mask  = modt.field(colname)  <= stop
-        modt2 = modt[mask]
+        pred  = (colname, 'in', start, stop)
 
     elif mc1 is not None:
         condition = condition.replace('!=', "")
-        mask  = tdata.field(colname) != condition
-        modt2 = tdata[mask]
+        pred  = (colname, '!=', convertCondValue(condition))
 
     else:
         condition = condition.replace('==', "")
-        if isinstance(condition, (float, int)):
-            mask  = tdata.field(colname) == condition
-            modt2 = tdata[mask]
+        if cform.endswith('L'):
+            pred = (colname, 'mask', condition)
         else:
-            data  = select_data_with_logical_mask(tbdata, colname, condition)
-            chk = 1
+            pred = (colname, '==', convertCondValue(condition))
 
+    filterTableData(ifile, pred, outname, extension=extension, clobber=clobber)
 
-    header  = pyfits.getheader(ifile)
-    if chk == 0:
-        data    = pyfits.BinTableHDU(modt2, header)
+#-------------------------------------------------------------------------------------------------------
+#-- convertCondValue: convert a value in a condition string to a number if possible                  ---
+#-------------------------------------------------------------------------------------------------------
+
+def convertCondValue(val):
+    """
+    convert a value in a condition string to a number if possible
+    Input:      val --- string
+    Output:     val --- int, float, or the string
+    """
+    try:
+        return int(val)
+    except ValueError:
+        pass
+    try:
+        return float(val)
+    except ValueError:
+        return val
+
+#-------------------------------------------------------------------------------------------------------
+#-- filterTableData: select rows of a table fits file matching a condition and write them            ---
+#-------------------------------------------------------------------------------------------------------
+
+def filterTableData(ifile, pred, outname, extension = 1, chunk = 1000000, clobber='no'):
+    """
+    select rows of a table fits file matching a condition and write them to a new table
+    fits file. the condition is evaluated on chunks of rows (see tableFilterMask) and
+    only the matching rows are copied
+    Input:      ifile    --- input table fits file
+                pred     --- condition; e.g. 
+                             ('and', ('time', 'in', 1.0e8, 2.0e8),
+                                     ('or', ('ccd_id', '==', 3), ('status', '&', 0x10)))
+                outname  --- output file name
+                extension--- extension #. default = 1
+                chunk    --- # of rows evaluated at once
+                clobber  --- overwrite the file if exists. if not given, 'no'
+    Output:     outname  --- table fits file of the selected rows
+                nsel     --- # of the selected rows
+    """
+    m1 = re.search('y', clobber)
+    m2 = re.search('Y', clobber)
+
+    if (m1 is not None) or (m2 is not None):
+        if os.path.isfile(outname):
+            os.remove(outname)
+
+    t      = pyfits.open(ifile)
+    tdata  = t[extension].data
+    header = t[extension].header
 
+    index  = []
+    for start in range(0, len(tdata), chunk):
+        mask = tableFilterMask(tdata[start:start+chunk], pred)
+        index.append(numpy.nonzero(mask)[0] + start)
+
+    if len(index) > 0:
+        index = numpy.concatenate(index)
+    else:
+        index = numpy.zeros(0, dtype=int)
+
+    data = pyfits.BinTableHDU(tdata[index], header)
     data.writeto(outname)
 
+    t.close()
+
+    return len(index)
+
 #-------------------------------------------------------------------------------------------------------
-#-- select_data_with_logical_mask: select out data and return data table                             ---
+#-- tableFilterMask: evaluate a condition on table data and return a boolean mask                    ---
 #-------------------------------------------------------------------------------------------------------
 
-def select_data_with_logical_mask(tbdata, col, mask):
+def tableFilterMask(tdata, pred):
     """
-    for given column name and logical mask, select out data and return data table
-    input:  tbdata  --- table data
-            col     --- column name to be examined
-            mask    --- original mask with possibly array of coditions
-    output: ntbdata --- table data with selected data rows
+    evaluate a condition on table data and return a boolean mask
+    Input:      tdata   --- table data
+                pred    --- condition in one of the forms:
+                            (col, op, value)        op: '==', '!=', '<', '<=', '>', '>='
+                            (col, 'in', start, stop) start <= col <= stop
+                            (col, '&', bits)        (col & bits) != 0
+                            (col, '&', bits, value) (col & bits) == value
+                            (col, 'mask', pattern)  logical array column matching a 
+                                                    pattern like 'x10x1' (x: any)
+                            ('and', pred1, pred2, ...)
+                            ('or',  pred1, pred2, ...)
+                            ('not', pred)
+    Output:     mask    --- boolean numpy array
     """
-#
-#--- find conlumn names
-#
-    col_names = tbdata.columns.names
-#
-#--- convert mask format from xxx1xxx (1 is True 0 is False and x is no checking)
-#
+    op = pred[0]
+    if op == 'and' or op == 'or':
+        mask = tableFilterMask(tdata, pred[1])
+        for ent in pred[2:]:
+            if op == 'and':
+                mask &= tableFilterMask(tdata, ent)
+            else:
+                mask |= tableFilterMask(tdata, ent)
+        return mask
+
+    elif op == 'not':
+        return ~tableFilterMask(tdata, pred[1])
+
+    col  = tdata.field(pred[0])
+    op   = pred[1]
+    if op == 'in':
+        mask = (col >= pred[2]) & (col <= pred[3])
+    elif op == '&':
+        bits = numpy.bitwise_and(col, pred[2])
+        if len(pred) > 3:
+            mask = bits == pred[3]
+        else:
+            mask = bits != 0
+    elif op == 'mask':
+        mask = logicalMaskRows(col, pred[2])
+    elif op in compare_ops:
+        mask = compare_ops[op](col, pred[2])
+    else:
+        raise ValueError('tableFilterMask: unknown operator: ' + str(op))
+
+    return numpy.asarray(mask, dtype=bool)
+
+#-------------------------------------------------------------------------------------------------------
+#-- logicalMaskRows: find rows of a logical array column matching a pattern                          ---
+#-------------------------------------------------------------------------------------------------------
+
+def logicalMaskRows(cdata, mask):
+    """
+    find rows of a logical array column matching a pattern
+    Input:  cdata   --- logical array column data (2D)
+            mask    --- pattern like 'x10x1' (1 is True 0 is False and x is no checking)
+    Output: boolean numpy array of the matching rows
+    """
+    cdata = numpy.asarray(cdata)
+    if cdata.ndim == 1:
+        cdata = cdata[:, numpy.newaxis]
+
     poslist   = []
     condition = []
     for i in range(0, len(mask)):
@@ -271,40 +794,32 @@ def select_data_with_logical_mask(tbdata, col, mask):
             continue
         else:
             poslist.append(i)
-            if ent == '1':
-                condition.append(True)
-            else:
-                condition.append(False)
-#
-#--- check each row of the column data to see whether the condition matches
-#
-    save = []
-    for rdata in tbdata:
-        ent = rdata[col]
-        lkey = True
-        for m in range(0, len(poslist)):
-            k = poslist[m]
-            if ent[k] != condition[m]:
-                lkey = False
-                break
-        if lkey == True:
-            save.append(rdata)
-#
-#--- recreate data table
-#
-    out = []
-    for col in col_names:
-        vdata = []
-        for ent in save:
-            val = ent.field(col)
-            vdata.append(val)
+            condition.append(ent == '1')
 
-        vcol = set_format_for_col(col, vdata)
-        out.append(vcol)
+    return numpy.all(cdata[:, poslist] == numpy.array(condition, dtype=bool), axis=1)
 
-    dcol    = pyfits.ColDefs(out)
-    dbhdu   = pyfits.BinTableHDU.from_columns(dcol)
-    ntbdata = dbhdu.data
+#-------------------------------------------------------------------------------------------------------
+#-- select_data_with_logical_mask: select out data and return data table                             ---
+#-------------------------------------------------------------------------------------------------------
+
+def select_data_with_logical_mask(tbdata, col, mask):
+    """
+    for given column name and logical mask, select out data and return data table
+    input:  tbdata  --- table data
+            col     --- column name to be examined
+            mask    --- original mask with possibly array of coditions
+    output: ntbdata --- table data with selected data rows. the column definitions
+                        are those of tbdata
+    """
+#
+#--- compare the whole column with the mask format xxx1xxx (1 is True 0 is False and x 
+#--- is no checking) at once
+#
+    rmask   = logicalMaskRows(tbdata.field(col), mask)
+#
+#--- copy the selected rows; the columns keep their formats
+#
+    ntbdata = tbdata[rmask]
 
     return ntbdata
 
@@ -353,14 +868,23 @@ def set_format_for_col(name, cdata):
 #-- fitsImgStat: find min, max, avg, std, and mediam of the image fits file                          ---
 #-------------------------------------------------------------------------------------------------------
 
-def fitsImgStat(ifile, extension=0):
+def fitsImgStat(ifile, extension=0, block=0, median='exact', nbin=65536):
 
     """
     find min, max, avg, std, and mediam of the image fits file
     Input:      file      --- image fits file name
                 extension --- data exteion #. default = 0
+                block     --- if > 0, the image is read in blocks of this # of rows
+                              (through hdu.section) and only a block is in memory
+                median    --- for block > 0: 'exact': the median is found by narrowing
+                              it down with histograms (a few more passes)
+                              'approx': interpolated in a histogram of nbin bins 
+                              between min and max (one more pass)
+                nbin      --- # of the histogram bins. default = 65536
     Output:     a list of [min, max, avg, std, med]
     """
+    if block > 0:
+        return fitsImgStatBlock(ifile, extension, block, median, nbin)
 
     t    = pyfits.open(ifile)
     data = t[extension].data
@@ -386,6 +910,185 @@ def fitsImgStat(ifile, extension=0):
 
     return results
 
+#-------------------------------------------------------------------------------------------------------
+#-- fitsImgStatBlock: find min, max, avg, std, and mediam of the image fits file block by block       --
+#-------------------------------------------------------------------------------------------------------
+
+def fitsImgStatBlock(ifile, extension=0, block=1024, median='exact', nbin=65536):
+    """
+    find min, max, avg, std, and mediam of the image fits file block by block. 
+    min, max, avg, and std are found in one pass; the mean and the sum of the squared
+    deviations of each block are merged to those of the earlier blocks
+    Input:      file      --- image fits file name
+                extension --- data exteion #. default = 0
+                block     --- # of rows in a block
+                median    --- 'exact' or 'approx'. see fitsImgStat
+                nbin      --- # of the histogram bins
+    Output:     a list of [min, max, avg, std, med]; all NaN if the image has a NaN
+    """
+    t   = pyfits.open(ifile)
+    hdu = t[extension]
+
+    tot  = 0
+    avg  = 0.0
+    ssq  = 0.0
+    dmin = numpy.inf
+    dmax = -numpy.inf
+    for data in imgBlocks(hdu, block):
+        cnt  = data.size
+        if cnt == 0:
+            continue
+        bavg = data.mean()
+#
+#--- a NaN pixel makes all the statistics NaN as with block = 0
+#
+        if numpy.isnan(bavg) and numpy.isnan(data).any():
+            t.close()
+            nan = float('nan')
+            return [nan, nan, nan, nan, nan]
+
+        bssq = numpy.square(data - bavg).sum()
+
+        delta = bavg - avg
+        ssq  += bssq + delta * delta * tot * cnt / (tot + cnt)
+        avg  += delta * cnt / (tot + cnt)
+        tot  += cnt
+        dmin  = min(dmin, data.min())
+        dmax  = max(dmax, data.max())
+
+    std = math.sqrt(ssq / tot)
+    if dmin == dmax:
+        t.close()
+        return [dmin, dmax, avg, std, dmin]
+#
+#--- median; the average of the two middle values if tot is even
+#
+    if median == 'approx':
+        (hist, edges) = imgHistogram(hdu, block, dmin, dmax, nbin, inclusive=True)
+        rank = 0.5 * (tot - 1)
+        cum  = numpy.cumsum(hist)
+        k    = int(numpy.searchsorted(cum, rank, side='right'))
+        prev = cum[k-1] if k > 0 else 0
+        med  = edges[k] + (rank - prev + 0.5) / hist[k] * (edges[k+1] - edges[k])
+        med  = min(max(med, dmin), dmax)
+    else:
+        med  = findImgRank(hdu, block, (tot - 1) // 2, dmin, dmax, nbin)
+        if tot % 2 == 0:
+            med = 0.5 * (med + findImgRank(hdu, block, tot // 2, dmin, dmax, nbin))
+
+    t.close()
+
+    return [dmin, dmax, avg, std, med]
+
+#-------------------------------------------------------------------------------------------------------
+#-- imgBlocks: read an image in blocks of rows                                                        --
+#-------------------------------------------------------------------------------------------------------
+
+def imgBlocks(hdu, block):
+    """
+    read an image in blocks of rows (along the first axis of the data array)
+    Input:      hdu     --- image hdu
+                block   --- # of rows in a block
+    Output:     flattened float64 array of each block (generator)
+    """
+    nrow = hdu.shape[0]
+    for start in range(0, nrow, block):
+        data = numpy.asarray(hdu.section[start:start+block], dtype=numpy.float64)
+        yield data.ravel()
+
+#-------------------------------------------------------------------------------------------------------
+#-- imgHistogram: make a histogram of an image block by block                                         --
+#-------------------------------------------------------------------------------------------------------
+
+def imgHistogram(hdu, block, lo, hi, nbin, inclusive=False):
+    """
+    make a histogram of the values lo <= v < hi (lo <= v <= hi if inclusive) of an image
+    block by block
+    Input:      hdu     --- image hdu
+                block   --- # of rows in a block
+                lo, hi  --- range of the histogram
+                nbin    --- # of the bins
+                inclusive-- include v == hi in the last bin
+    Output:     hist    --- counts; bin k is edges[k] <= v < edges[k+1]
+                edges   --- bin edges
+                nbelow  --- # of values < lo         (if not inclusive)
+                vmin    --- min of the values in the range (if not inclusive)
+                vmax    --- max of the values in the range (if not inclusive)
+    """
+    hist   = numpy.zeros(nbin, dtype=numpy.int64)
+    edges  = numpy.linspace(lo, hi, nbin + 1)
+    nbelow = 0
+    vmin   = numpy.inf
+    vmax   = -numpy.inf
+    for data in imgBlocks(hdu, block):
+        nbelow += numpy.count_nonzero(data < lo)
+        if inclusive:
+            data = data[(data >= lo) & (data <= hi)]
+        else:
+            data = data[(data >= lo) & (data < hi)]
+        if len(data) > 0:
+            vmin = min(vmin, data.min())
+            vmax = max(vmax, data.max())
+
+        (part, edges) = numpy.histogram(data, bins=nbin, range=(lo, hi))
+        hist += part
+
+    if inclusive:
+        return (hist, edges)
+
+    return (hist, edges, nbelow, vmin, vmax)
+
+#-------------------------------------------------------------------------------------------------------
+#-- findImgRank: find the value of a given rank in an image block by block                            --
+#-------------------------------------------------------------------------------------------------------
+
+def findImgRank(hdu, block, rank, dmin, dmax, nbin=65536, limit=1000000):
+    """
+    find the value of a given rank (0 based) in an image block by block. the range
+    holding it is narrowed with histograms until it has no more than limit values;
+    then the values are collected and the rank is selected among them. if all values
+    in the range are the same (e.g. a large number of zero pixels), that is the answer
+    Input:      hdu     --- image hdu
+                block   --- # of rows in a block
+                rank    --- rank of the value
+                dmin    --- min of the image
+                dmax    --- max of the image
+                nbin    --- # of the histogram bins
+                limit   --- max # of the values to collect
+    Output:     the value
+    """
+    lo    = dmin
+    hi    = numpy.nextafter(dmax, numpy.inf)
+    below = 0
+    while True:
+#
+#--- the range is too narrow to be split into nbin bins; collect the values
+#
+        edges = numpy.linspace(lo, hi, nbin + 1)
+        if not numpy.all(edges[1:] > edges[:-1]):
+            break
+
+        (hist, edges, nbelow, vmin, vmax) = imgHistogram(hdu, block, lo, hi, nbin)
+        if vmin == vmax:
+            return float(vmin)
+
+        cum   = nbelow + numpy.cumsum(hist)
+        k     = int(numpy.searchsorted(cum, rank, side='right'))
+        lo    = edges[k]
+        hi    = edges[k+1]
+        below = cum[k] - hist[k]
+        if hist[k] <= limit:
+            break
+
+    save  = []
+    for data in imgBlocks(hdu, block):
+        save.append(data[(data >= lo) & (data < hi)])
+
+    save = numpy.concatenate(save)
+    pos  = rank - below
+
+    return float(numpy.partition(save, pos)[pos])
+
 #-------------------------------------------------------------------------------------------------------
 #-- maxPosImgFits: find physical location of max value                                               ---
 #-------------------------------------------------------------------------------------------------------
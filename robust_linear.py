@@ -11,55 +11,586 @@
 #                                                                                           #
 #############################################################################################
 
-import random
 import math
+import warnings
+import multiprocessing
+import numpy
+#
+#--- data held by a bootstrap worker process (see init_bootstrap_worker)
+#
+bootstrap_data = {}
 
 #-------------------------------------------------------------------------------------------
 #-- robust_fit: compute a linear fit parameters using rubst fit                          ---
 #-------------------------------------------------------------------------------------------
 
-def robust_fit(x, y, iter=0):
+def robust_fit(x, y, iter=0, method='medfit', nsample=10000, seed=None):
     """
     compute a linear fit parameters using rubst fit
-    Input:      x   --- a list of independent variable
-                y   --- a list of dependent variable
+    Input:      x   --- a list (or numpy array) of independent variable
+                y   --- a list (or numpy array) of dependent variable
                 iter--- if it is larger than 0, the error in a slope is computed
+                method- 'medfit':   least absolute deviation fit (Numerical Recipes)
+                        'theilsen': Theil-Sen estimator; the median of the pairwise
+                                    slopes (breakdown point about 29%). see theil_sen
+                        'exact':    least absolute deviation fit found exactly
+                                    by pivoting between data points. see medfit_exact
+                        'subsample':medfit on stratified random subsets of nsample
+                                    data (iter subsets if iter > 0); the full data
+                                    are fitted with medfit if there are not more
+                                    than nsample data. see subsample_fit
+                nsample-- # of data in a subset for method='subsample'
+                seed--- seed of the random numbers of the bootstrap (iter > 0) and of
+                        the subsets for method='subsample'; None: not reproducible
     Output:     alpna   --- intersection
                 beta    --- slope
-                berr    ---- error of slope if iter > 0
+                berr    ---- error of slope if iter > 0 (bootstrap with medfit, with
+                             theil_sen for method='theilsen', or the scatter of the
+                             subset fits for method='subsample')
     """
-    tot = len(x)
-    sumx = 0.0
-    sumy = 0.0
+    x = numpy.asarray(x, dtype=float)
+    y = numpy.asarray(y, dtype=float)
+
+    if method == 'theilsen':
+        (alpha, beta) = theil_sen(x, y)
+        if iter > 0:
+            berr = find_ebar_theilsen(x, y, rounds = iter, seed = seed)
+        else:
+            berr = -999
+
+        return (alpha, beta, berr)
+
+    elif method == 'exact':
+        (alpha, beta) = medfit_exact(x, y)
+        if iter > 0:
+            berr = find_ebar(x, y, rounds = iter, seed = seed)
+        else:
+            berr = -999
+
+        return (alpha, beta, berr)
+
+    elif method == 'subsample':
+        if len(x) > nsample:
+            return subsample_fit(x, y, nsample=nsample, rounds=max(iter, 1), seed=seed)
+
+    elif method != 'medfit':
+        raise ValueError('robust_fit: unknown method: ' + str(method))
 #
 #---robust fit works better if the intercept is close to the middle of the data cluster.
 #
-    for n in range(0, tot):
-        sumx += x[n]
-        sumy += y[n]
+    xavg = x.mean()
+    yavg = y.mean()
 
-    xavg = sumx / tot
-    yavg = sumy / tot
-
-    xval = []
-    yval = []
-    for n in range(0, tot):
-        xval.append(x[n] - xavg)
-        yval.append(y[n] - yavg)
+    xval = x - xavg
+    yval = y - yavg
 
     (alpha, beta) = medfit(xval, yval)
 
     alpha += beta * (-1.0 * xavg) + yavg
+    alpha  = float(alpha)
+    beta   = float(beta)
 #
 #--- estimate the error in the slope
 #
     if iter > 0:
-        berr = find_ebar(x, y, rounds = iter)
+        berr = find_ebar(x, y, rounds = iter, seed = seed)
     else:
         berr = -999
 
     return (alpha, beta, berr)
 
+#-------------------------------------------------------------------------------------------
+#-- subsample_fit: compute a linear fit parameters using robust fit on subsets            --
+#-------------------------------------------------------------------------------------------
+
+def subsample_fit(x, y, nsample=10000, rounds=10, seed=None):
+    """
+    compute a linear fit parameters using robust fit on stratified random subsets of
+    the data. the data are split into nsample consecutive pieces of the same size 
+    (time ranges for a time ordered series) and one data point is drawn from each.
+    all subsets are fitted together with medfit_batch and the cost does not depend 
+    on the size of the data
+    Input:      x       --- a numpy array of independent variable
+                y       --- a numpy array of dependent variable
+                nsample --- # of data in a subset
+                rounds  --- # of subsets
+                seed    --- seed of the random number generator. default: None
+    Output:     alpha   --- intersection; the mean of the subset fits
+                beta    --- slope; the mean of the subset fits
+                berr    --- error of the slope; the standard deviation of the subset
+                            slopes divided by sqrt(# of subsets). -999 if rounds < 2
+    """
+    tot = len(x)
+    rng = numpy.random.default_rng(seed)
+#
+#--- one random position in each of the nsample pieces
+#
+    edge = numpy.arange(nsample) * (tot / nsample)
+    pos  = edge + rng.random((rounds, nsample)) * (tot / nsample)
+    pos  = numpy.minimum(pos.astype(numpy.int64), tot - 1)
+
+    (alpha, beta, conv) = robust_fit_batch(x[pos], y[pos])
+    if conv.any():
+        alpha = alpha[conv]
+        beta  = beta[conv]
+
+    if len(beta) > 1:
+        berr = float(beta.std() / math.sqrt(len(beta)))
+    else:
+        berr = -999
+
+    return (float(alpha.mean()), float(beta.mean()), berr)
+
+#-------------------------------------------------------------------------------------------
+#-- theil_sen: compute a linear fit parameters with Theil-Sen estimator                   --
+#-------------------------------------------------------------------------------------------
+
+def theil_sen(x, y, seed=None):
+    """
+    compute a linear fit parameters with Theil-Sen estimator. the slope is the median of
+    the slopes (y_j - y_i)/(x_j - x_i) of all pairs with x_i != x_j, and the intercept is 
+    the median of y - slope * x. the median slope is found by randomized selection
+    without listing all pairs (O(n log n) steps per pass, a few passes)
+    Input:  x       --- a list (or numpy array) of independent variable
+            y       --- a list (or numpy array) of dependent variable
+            seed    --- seed of the random numbers used for the selection. the result
+                        does not depend on it
+    Output: alpha   --- intersect
+            beta    --- slope
+    """
+    x = numpy.asarray(x, dtype=float)
+    y = numpy.asarray(y, dtype=float)
+#
+#--- centering keeps y - t * x accurate
+#
+    xavg = x.mean()
+    yavg = y.mean()
+    xval = x - xavg
+    yval = y - yavg
+
+    tot  = len(xval)
+    (vals, gcnt) = numpy.unique(xval, return_counts=True)
+    npair = tot * (tot - 1) // 2 - int((gcnt * (gcnt - 1) // 2).sum())
+    if npair == 0:
+        raise ValueError('theil_sen: all x values are the same')
+#
+#--- the two middle ranks of the sorted pairwise slopes
+#
+    rng = numpy.random.default_rng(seed)
+    k1  = (npair - 1) // 2
+    k2  = npair // 2
+    s1  = select_pair_slope(xval, yval, k1, rng)
+    if k2 == k1:
+        s2 = s1
+    else:
+        s2 = select_pair_slope(xval, yval, k2, rng)
+
+    beta  = 0.5 * (s1 + s2)
+    alpha = numpy.median(yval - beta * xval) + yavg - beta * xavg
+
+    return (float(alpha), float(beta))
+
+#-------------------------------------------------------------------------------------------
+#-- select_pair_slope: find the k-th smallest pairwise slope                              --
+#-------------------------------------------------------------------------------------------
+
+def select_pair_slope(x, y, k, rng, limit=0):
+    """
+    find the k-th smallest (0 based) pairwise slope. an interval (lo, hi] holding it
+    is narrowed with the quantiles of random pairwise slopes drawn from the interval,
+    until the interval is small enough to list all its slopes
+    Input:  x, y    --- numpy arrays of independent and dependent variables
+            k       --- rank of the slope
+            rng     --- numpy.random.Generator
+            limit   --- list the slopes if the interval has fewer than this. 
+                        default: 0 (32 * # of data)
+    Output: the slope
+    """
+    tot = len(x)
+    if limit <= 0:
+        limit = max(32 * tot, 100000)
+
+    lo    = -numpy.inf
+    hi    = numpy.inf
+    below = 0
+    scale = numpy.abs(y).max() / numpy.abs(x).max()
+    (pidx, rank) = slope_interval_order(x, y, lo, hi)
+    nin   = count_inversions(rank)
+    for iter in range(0, 100):
+#
+#--- the interval holds only one value (many pairs have the same slope)
+#
+        if numpy.nextafter(lo, numpy.inf) == hi:
+            return hi
+#
+#--- the interval is small: list all slopes in it and select
+#
+        if nin <= limit:
+            break
+#
+#--- draw random slopes from the interval and take the quantiles around the rank
+#
+        nsamp  = min(max(tot, 1000), nin)
+        target = numpy.sort(rng.integers(0, nin, size=nsamp))
+        sample = numpy.sort(interval_slopes(x, y, pidx, rank, target))
+
+        spread = 3.0 * math.sqrt(nsamp)
+        pos    = float(k - below) / nin * nsamp
+        i1     = int(math.floor(pos - spread))
+        i2     = int(math.ceil(pos + spread))
+        if i1 >= 0:
+            nlo = sample[i1]
+        else:
+            nlo = lo
+        if i2 < nsamp:
+            nhi = sample[i2]
+        else:
+            nhi = hi
+#
+#--- a quantile repeated in the sample may be a large block of equal slopes (quantized 
+#--- data) which cannot be split. if the rank is in a narrow interval around it, 
+#--- all slopes there are the same value up to the rounding of the comparisons 
+#
+        for val in set((nlo, nhi)) - set((lo, hi)):
+            nrep = numpy.searchsorted(sample, val, side='right') \
+                 - numpy.searchsorted(sample, val, side='left')
+            if nrep < 2:
+                continue
+
+            eps = 1.0e-12 * (abs(val) + scale)
+            tlo = max(val - eps, lo)
+            thi = min(val + eps, hi)
+            clo = below + count_slopes(x, y, lo, tlo)
+            (npidx, nrank) = slope_interval_order(x, y, tlo, thi)
+            nnin = count_inversions(nrank)
+            if clo <= k and k < clo + nnin:
+                if nnin > limit:
+                    return val
+
+                (lo, hi, below, pidx, rank, nin) = (tlo, thi, clo, npidx, nrank, nnin)
+                break
+
+        if nin <= limit:
+            break
+
+        if nlo >= nhi:
+            continue
+#
+#--- check that the new interval still holds the rank; otherwise draw again
+#
+        clo = below + count_slopes(x, y, lo, nlo)
+        (npidx, nrank) = slope_interval_order(x, y, nlo, nhi)
+        nnin = count_inversions(nrank)
+        if clo <= k and k < clo + nnin:
+            lo    = nlo
+            hi    = nhi
+            below = clo
+            pidx  = npidx
+            rank  = nrank
+            nin   = nnin
+
+    if nin > limit:
+        raise RuntimeError('select_pair_slope: the slope interval did not narrow down')
+
+    slopes = interval_slopes(x, y, pidx, rank, numpy.arange(nin))
+    kin    = min(max(k - below, 0), len(slopes) - 1)
+
+    return numpy.partition(slopes, kin)[kin]
+
+#-------------------------------------------------------------------------------------------
+#-- count_slopes: count pairwise slopes in (lo, hi]                                       --
+#-------------------------------------------------------------------------------------------
+
+def count_slopes(x, y, lo, hi):
+    """
+    count pairwise slopes in (lo, hi]
+    Input:  x, y    --- numpy arrays of independent and dependent variables
+            lo, hi  --- the interval (can be -inf or inf)
+    Output: # of pairs (with x_i != x_j) of which slope is in the interval
+    """
+    if hi <= lo:
+        return 0
+
+    (pidx, rank) = slope_interval_order(x, y, lo, hi)
+
+    return count_inversions(rank)
+
+#-------------------------------------------------------------------------------------------
+#-- slope_interval_order: order the data so that slopes in (lo, hi] become inversions     --
+#-------------------------------------------------------------------------------------------
+
+def slope_interval_order(x, y, lo, hi):
+    """
+    order the data so that pairs of which slope is in (lo, hi] become inversions.
+    for a pair i, j with x_i < x_j, (y_j - t x_j) - (y_i - t x_i) has the sign of
+    slope - t; the data are ordered by y - lo x, and a pair is an inversion if its
+    order by y - hi x is reversed
+    Input:  x, y    --- numpy arrays of independent and dependent variables
+            lo, hi  --- the interval (can be -inf or inf)
+    Output: pidx    --- the data index of each position in the order
+            rank    --- rank of each position in the order by y - hi x; the pairs
+                        with the slope in (lo, hi] are exactly the inversions. pairs
+                        with x_i == x_j are never inversions
+    """
+    tot = len(x)
+#
+#--- order by y - lo x; the ties are ordered by y - hi x
+#
+    if hi == numpy.inf:
+        hkeys = [y, -x]
+    else:
+        hkeys = [y - hi * x]
+
+    if lo == -numpy.inf:
+        lkey = x
+        pidx = lexsort_fast(hkeys + [y, x])
+    else:
+        lkey = y - lo * x
+        pidx = lexsort_fast(hkeys + [lkey])
+#
+#--- rank by y - hi x; ties are ranked in the reverse order of y - lo x so that they
+#--- count as inversions (slope == hi is in the interval); identical points keep the order
+#
+    pos  = numpy.arange(tot)
+    lneg = -lkey[pidx]
+    if lo == -numpy.inf:
+        lsub = [-y[pidx]]
+    else:
+        lsub = []
+    order = lexsort_fast([pos] + lsub + [lneg] + [ent[pidx] for ent in hkeys])
+    rank  = numpy.empty(tot, dtype=numpy.int64)
+    rank[order] = pos
+
+    return (pidx, rank)
+
+#-------------------------------------------------------------------------------------------
+#-- lexsort_fast: numpy.lexsort which sorts only the primary key if it has no tie        ---
+#-------------------------------------------------------------------------------------------
+
+def lexsort_fast(keys):
+    """
+    numpy.lexsort which sorts only the primary key if it has no tie
+    Input:  keys    --- a list of key arrays; the last one is the primary key
+    Output: order   --- the indices which sort the keys
+    """
+    order = numpy.argsort(keys[-1], kind='stable')
+    if len(keys) > 1:
+        skey = keys[-1][order]
+        if numpy.any(skey[1:] == skey[:-1]):
+            return numpy.lexsort(keys)
+
+    return order
+
+#-------------------------------------------------------------------------------------------
+#-- inversion_levels: walk the levels of a bottom-up merge sort                           --
+#-------------------------------------------------------------------------------------------
+
+def inversion_levels(rank):
+    """
+    walk the levels of a bottom-up merge sort of a permutation. at each level, 
+    the elements of each right block are compared with its sorted left block
+    Input:  rank    --- a permutation of 0 ... n-1 (numpy int array)
+    Output: iterator of (lvals, start, cnt, rvals)
+            lvals   --- the values of the left blocks, sorted in each block
+            start   --- for each element of the right blocks, the position in lvals
+                        of the first larger value in its left block
+            cnt     --- # of larger values in its left block (# of inversions)
+            rvals   --- the values of the right block elements
+    """
+    tot  = len(rank)
+#
+#--- pad to a power of 2 with increasing values larger than any rank; they add no inversion
+#
+    size = 1
+    while size < tot:
+        size *= 2
+    vals = numpy.concatenate((numpy.asarray(rank, dtype=numpy.int64), numpy.arange(tot, size)))
+
+    width = 1
+    while width < size:
+        npair = size // (2 * width)
+        offs  = (numpy.arange(npair, dtype=numpy.int64) * size)[:, numpy.newaxis, numpy.newaxis]
+        keys  = (vals.reshape(npair, 2, width) + offs)
+
+        lkeys = keys[:, 0, :].ravel()
+        rkeys = keys[:, 1, :].ravel()
+        start = numpy.searchsorted(lkeys, rkeys, side='right')
+        cnt   = numpy.repeat(numpy.arange(1, npair + 1) * width, width) - start
+
+        yield (vals.reshape(npair, 2, width)[:, 0, :].ravel(), start, cnt,\
+               vals.reshape(npair, 2, width)[:, 1, :].ravel())
+
+        keys  = numpy.sort(keys.reshape(npair, 2 * width), axis=1, kind='stable')
+        vals  = (keys - offs[:, :, 0]).ravel()
+        width *= 2
+
+#-------------------------------------------------------------------------------------------
+#-- count_inversions: count inversions of a permutation                                   --
+#-------------------------------------------------------------------------------------------
+
+def count_inversions(rank):
+    """
+    count inversions of a permutation
+    Input:  rank    --- a permutation of 0 ... n-1 (numpy int array)
+    Output: # of pairs i < j with rank[i] > rank[j]
+    """
+    total = 0
+    for (lvals, start, cnt, rvals) in inversion_levels(rank):
+        total += int(cnt.sum())
+
+    return total
+
+#-------------------------------------------------------------------------------------------
+#-- interval_slopes: compute the slopes of the selected inversion pairs                  ---
+#-------------------------------------------------------------------------------------------
+
+def interval_slopes(x, y, pidx, rank, target):
+    """
+    compute the slopes of the selected inversion pairs (see slope_interval_order)
+    Input:  x, y    --- numpy arrays of independent and dependent variables
+            pidx    --- the data index of each position in the order
+            rank    --- rank of each position
+            target  --- sorted array of inversion numbers (0 ... # of inversions - 1)
+                        in the order they are found by inversion_levels
+    Output: slopes  --- the slopes of the pairs; the pairs with x_i == x_j are dropped
+    """
+    tot    = len(rank)
+    rinv   = numpy.empty(tot, dtype=numpy.int64)
+    rinv[rank] = numpy.arange(tot)
+
+    target = numpy.asarray(target, dtype=numpy.int64)
+    offset = 0
+    slist  = []
+    for (lvals, start, cnt, rvals) in inversion_levels(rank):
+        csum = numpy.cumsum(cnt)
+        if len(csum) == 0:
+            continue
+        lvl  = target[numpy.searchsorted(target, offset):numpy.searchsorted(target, offset + csum[-1])]
+        if len(lvl) > 0:
+#
+#--- the right block element and the position in its left block of each target
+#
+            loc  = lvl - offset
+            relm = numpy.searchsorted(csum, loc, side='right')
+            prev = csum[relm] - cnt[relm]
+            lval = lvals[start[relm] + (loc - prev)]
+
+            ia   = pidx[rinv[lval]]
+            ib   = pidx[rinv[rvals[relm]]]
+            slist.append((y[ib] - y[ia]) / (x[ib] - x[ia]))
+
+        offset += int(csum[-1])
+
+    if len(slist) == 0:
+        return numpy.zeros(0)
+
+    return numpy.concatenate(slist)
+
+#-------------------------------------------------------------------------------------------
+#-- robust_fit_batch: compute linear fit parameters of many data sets using robust fit    --
+#-------------------------------------------------------------------------------------------
+
+def robust_fit_batch(x, y):
+    """
+    compute linear fit parameters of many data sets of the same length using robust fit.
+    all data sets are fitted together (see medfit_batch)
+    Input:      x   --- independent variable; a 1D array shared by all data sets or 
+                        a 2D array with a row for each data set
+                y   --- 2D array of dependent variable; a row for each data set
+    Output:     alpha   --- array of intersections
+                beta    --- array of slopes
+                conv    --- boolean array; False if the fit did not converge. the least
+                            sq. values are given for those rows as robust_fit does
+    """
+    y = numpy.atleast_2d(numpy.asarray(y, dtype=float))
+    x = numpy.asarray(x, dtype=float)
+    x = numpy.broadcast_to(x, y.shape)
+#
+#---robust fit works better if the intercept is close to the middle of the data cluster.
+#
+    xavg = x.mean(axis=1)
+    yavg = y.mean(axis=1)
+
+    xval = x - xavg[:, numpy.newaxis]
+    yval = y - yavg[:, numpy.newaxis]
+
+    (alpha, beta, conv) = medfit_batch(xval, yval)
+
+    alpha = alpha - beta * xavg + yavg
+
+    return (alpha, beta, conv)
+
+#-------------------------------------------------------------------------------------------
+#-- rolling_robust_fit: compute robust fit parameters in a sliding window                 --
+#-------------------------------------------------------------------------------------------
+
+def rolling_robust_fit(x, y, width, step, start=None, bstep=0.5):
+    """
+    compute robust fit parameters in a sliding window. the windows are [t, t + width)
+    with t = start, start + step, start + 2 * step, ... and the slope search of each
+    window starts from the slope of the previous window
+    Input:      x       --- a list (or numpy array) of independent variable
+                y       --- a list (or numpy array) of dependent variable
+                width   --- width of the window in the unit of x
+                step    --- step of the window in the unit of x
+                start   --- the beginning of the first window. default: None (min of x)
+                bstep   --- the first bracketing step of the warm started search in the 
+                            unit of the least sq. slope error (see medfit)
+    Output:     xcent   --- array of the window centers
+                alpha   --- array of intersections
+                beta    --- array of slopes
+                cnt     --- array of # of data in the window. alpha and beta are nan
+                            if the window has less than 3 data or a single x value
+    """
+    x = numpy.asarray(x, dtype=float)
+    y = numpy.asarray(y, dtype=float)
+
+    if width <= 0 or step <= 0:
+        raise ValueError('rolling_robust_fit: width and step must be positive')
+
+    order = numpy.argsort(x, kind='stable')
+    x     = x[order]
+    y     = y[order]
+
+    if start is None:
+        start = x[0]
+
+    nwin  = max(int(math.floor((x[-1] - start - width) / step)) + 1, 1)
+    tbeg  = start + step * numpy.arange(nwin)
+    lo    = numpy.searchsorted(x, tbeg, side='left')
+    hi    = numpy.searchsorted(x, tbeg + width, side='left')
+
+    xcent = tbeg + 0.5 * width
+    cnt   = hi - lo
+    alpha = numpy.full(nwin, numpy.nan)
+    beta  = numpy.full(nwin, numpy.nan)
+
+    bprev = None
+    for k in range(nwin):
+        if cnt[k] < 3:
+            continue
+
+        xs = x[lo[k]:hi[k]]
+        ys = y[lo[k]:hi[k]]
+        if xs[0] == xs[-1]:
+            continue
+#
+#--- center the window as robust_fit does
+#
+        xavg = xs.mean()
+        yavg = ys.mean()
+
+        if bprev is None:
+            (aa, bb) = medfit(xs - xavg, ys - yavg)
+        else:
+            (aa, bb) = medfit(xs - xavg, ys - yavg, bstart=bprev, bstep=bstep)
+
+        alpha[k] = aa - bb * xavg + yavg
+        beta[k]  = bb
+        bprev    = bb
+
+    return (xcent, alpha, beta, cnt)
+
 #-------------------------------------------------------------------------------------------
 #-- least_sq: compute a linear fit parameters using least sq method                      ---
 #-------------------------------------------------------------------------------------------
@@ -73,17 +604,14 @@ def least_sq(xval, yval):
             bb      --- slope
             delta   --- denominator
     """
-    tot = len(xval)
-    sx  = 0.0
-    sy  = 0.0
-    sxy = 0.0
-    sxx = 0.0
+    xval = numpy.asarray(xval, dtype=float)
+    yval = numpy.asarray(yval, dtype=float)
 
-    for j in range(0, tot):
-        sx  += xval[j]
-        sy  += yval[j]
-        sxy += xval[j] * yval[j]
-        sxx += xval[j] * xval[j]
+    tot = len(xval)
+    sx  = xval.sum()
+    sy  = yval.sum()
+    sxy = numpy.dot(xval, yval)
+    sxx = numpy.dot(xval, xval)
 
     delta = tot * sxx - sx * sx
 
@@ -96,14 +624,19 @@ def least_sq(xval, yval):
 #-- medfit: fit a straight line according to robust fit                                  ---
 #-------------------------------------------------------------------------------------------
 
-def medfit(xval, yval):
+def medfit(xval, yval, bstart=None, bstep=3.0):
     """
     fit a straight line according to robust fit Numerical Recipes (FORTRAN version) p.544
     Input:  xval    --- a list of independent variable
             yval    --- a list of dependent variable
+            bstart  --- slope to start the bracketing from. default: None (least sq. slope)
+            bstep   --- the first bracketing step in the unit of the least sq. slope error
     Output: alpha   --- intersect
             beta    --- slope
     """
+    xval = numpy.asarray(xval, dtype=float)
+    yval = numpy.asarray(yval, dtype=float)
+
     tot = len(xval)
 #
 #--- first compute a least sq. solution
@@ -115,15 +648,15 @@ def medfit(xval, yval):
     asave = aa
     bsave = bb
 
-    chisq = 0.0
-    for j in range(0, tot):
-        diff   = yval[j] - (aa + bb * xval[j])
-        chisq += diff * diff
+    diff  = yval - (aa + bb * xval)
+    chisq = numpy.dot(diff, diff)
 
     sigb       = math.sqrt(chisq / delta)
+    if bstart is not None:
+        bb     = bstart
     b1         = bb
     (f1, abdev)= rofunc(b1, xval, yval)
-    b2         = bb + sign(3.0 * sigb, f1)
+    b2         = bb + sign(bstep * sigb, f1)
     (f2, abdev)= rofunc(b2, xval, yval)
 
     iter = 0
@@ -166,6 +699,185 @@ def medfit(xval, yval):
 
     return (alpha, beta)
 
+#-------------------------------------------------------------------------------------------
+#-- medfit_exact: fit a straight line with the exact least absolute deviation             --
+#-------------------------------------------------------------------------------------------
+
+def medfit_exact(xval, yval):
+    """
+    fit a straight line with the exact least absolute deviation. a best line passes 
+    through two data points. starting from a data point (pivot), the best line through
+    the pivot has the weighted median of the slopes (y_i - y_p)/(x_i - x_p) with the 
+    weights |x_i - x_p|; the other data point on the line becomes the next pivot.
+    the sum of the absolute deviations decreases at each step and the search stops
+    when it does not (Wesolowsky 1981). it takes a few O(n) steps 
+    Input:  xval    --- a list (or numpy array) of independent variable
+            yval    --- a list (or numpy array) of dependent variable
+    Output: alpha   --- intersect
+            beta    --- slope
+    """
+    x = numpy.asarray(xval, dtype=float)
+    y = numpy.asarray(yval, dtype=float)
+
+    if len(x) < 2 or x.min() == x.max():
+        raise ValueError('medfit_exact: at least two different x values are needed')
+#
+#--- centering keeps the slopes and the deviations accurate
+#
+    xavg = x.mean()
+    yavg = y.mean()
+    x    = x - xavg
+    y    = y - yavg
+#
+#--- start from the data point at the median of the residuals of the least sq. fit
+#--- or, for a large data set, of the fit to a subset of the data (fewer steps)
+#
+    nsub = len(x) // 10000
+    if nsub > 1 and x[::nsub].min() < x[::nsub].max():
+        (aa, bb) = medfit_exact(x[::nsub], y[::nsub])
+    else:
+        (aa, bb, delta) = least_sq(x, y)
+    res   = y - bb * x
+    nmed  = (len(res) - 1) // 2
+    pivot = int(numpy.argpartition(res, nmed)[nmed])
+
+    dprev = numpy.inf
+    fixed = -1
+    while True:
+        dx   = x - x[pivot]
+        dy   = y - y[pivot]
+        good = numpy.nonzero(dx != 0.0)[0]
+        slope= dy[good] / dx[good]
+        k    = weighted_median(slope, numpy.abs(dx[good]))
+
+        beta  = slope[k]
+        alpha = y[pivot] - beta * x[pivot]
+        dsum  = numpy.abs(y - alpha - beta * x).sum()
+        if dsum < dprev:
+            (asave, bsave) = (alpha, beta)
+            dprev = dsum
+            pivot = int(good[k])
+            continue
+#
+#--- no improvement around this pivot. if more than two data points are on the line,
+#--- the line is the best only if turning it around any of them does not improve it
+#
+        if pivot == fixed:
+            break
+
+        fixed = find_lad_pivot(x, y, asave, bsave)
+        if fixed < 0:
+            break
+
+        pivot = fixed
+
+    alpha = asave - bsave * xavg + yavg
+
+    return (float(alpha), float(bsave))
+
+#-------------------------------------------------------------------------------------------
+#-- find_lad_pivot: find a data point on a line to turn the line around                   --
+#-------------------------------------------------------------------------------------------
+
+def find_lad_pivot(x, y, alpha, beta):
+    """
+    find a data point on a line such that turning the line around it reduces the sum
+    of the absolute deviations. turning around the point p changes the sum at the rate
+    +/- SUM[sign(r_i) * (x_i - x_p)] + SUM[|x_i - x_p|] where r_i is the residual and the
+    first sum is over the data off the line and the second one on the line
+    Input:  x, y    --- numpy arrays of independent and dependent variables
+            alpha   --- intersect of the line
+            beta    --- slope of the line
+    Output: index of the data point; -1 if there is none (the line is the best)
+    """
+    res  = y - alpha - beta * x
+    tol  = 1.0e-12 * (numpy.abs(y).max() + abs(beta) * numpy.abs(x).max())
+    on   = numpy.abs(res) <= tol
+    sgn  = numpy.sign(res[~on])
+    s0   = sgn.sum()
+    s1   = numpy.dot(sgn, x[~on])
+#
+#--- SUM[|x_i - x_p|] over the data on the line for each p with the cumulative sums
+#
+    pidx = numpy.nonzero(on)[0]
+    pidx = pidx[numpy.argsort(x[pidx], kind='stable')]
+    xon  = x[pidx]
+    csum = numpy.cumsum(xon)
+    j    = numpy.arange(len(xon))
+    asum = xon * (2 * j + 2 - len(xon)) - 2.0 * csum + csum[-1]
+
+    excess = numpy.abs(s1 - s0 * xon) - asum
+    k      = int(numpy.argmax(excess))
+    if excess[k] <= 1.0e-12 * len(x) * numpy.abs(x).max():
+        return -1
+
+    return int(pidx[k])
+
+#-------------------------------------------------------------------------------------------
+#-- weighted_median: find the weighted median                                             --
+#-------------------------------------------------------------------------------------------
+
+def weighted_median(vals, wts):
+    """
+    find the weighted median; the smallest value at which the sum of the weights of 
+    the values not larger than it reaches a half of the total. the candidate set is
+    narrowed to a bracket guessed from a sample of the values, or halved with 
+    numpy.partition if the guess misses (linear time)
+    Input:  vals    --- numpy array of values
+            wts     --- numpy array of non-negative weights
+    Output: index of the weighted median in vals
+    """
+    idx  = numpy.arange(len(vals))
+    half = 0.5 * wts.sum()
+    below= 0.0
+    while len(vals) > 1:
+#
+#--- bracket the weighted median with the weighted quantiles of a sample
+#
+        if len(vals) > 4096:
+            step = len(vals) // 2048
+            sv   = vals[::step]
+            sw   = wts[::step]
+            order= numpy.argsort(sv)
+            cw   = numpy.cumsum(sw[order])
+            frac = (half - below) / wts.sum()
+            pos  = numpy.searchsorted(cw, [(frac - 0.05) * cw[-1], (frac + 0.05) * cw[-1]])
+            pos  = numpy.minimum(pos, len(sv) - 1)
+            lo   = sv[order[pos[0]]]
+            hi   = sv[order[pos[1]]]
+
+            low  = vals < lo
+            inner= (vals <= hi) & ~low
+            wlow = numpy.dot(wts, low)
+            win  = numpy.dot(wts, inner)
+            nin  = numpy.count_nonzero(inner)
+            if below + wlow < half <= below + wlow + win and nin < len(vals) // 2:
+                below += wlow
+                (vals, wts, idx) = (vals[inner], wts[inner], idx[inner])
+                continue
+#
+#--- otherwise halve the candidates
+#
+        mid = (len(vals) - 1) // 2
+        cut = numpy.partition(vals, mid)[mid]
+
+        low  = vals <  cut
+        wlow = numpy.dot(wts, low)
+        if below + wlow >= half:
+            (vals, wts, idx) = (vals[low], wts[low], idx[low])
+            continue
+
+        eq   = vals == cut
+        weq  = numpy.dot(wts, eq)
+        if below + wlow + weq >= half:
+            return int(idx[eq][0])
+
+        below += wlow + weq
+        high   = vals > cut
+        (vals, wts, idx) = (vals[high], wts[high], idx[high])
+
+    return int(idx[0])
+
 #-------------------------------------------------------------------------------------------
 #-- rofunc: evaluatate 0 = SUM[ x *sign(y - a bx)]                                       ---
 #-------------------------------------------------------------------------------------------
@@ -174,28 +886,25 @@ def rofunc(b_in, xval, yval):
     """
     evaluatate 0 = SUM[ x *sign(y - a bx)]
     Input:  b_in    --- slope
-            xval    --- a list of independent variable
-            yval    --- al ist of dependent variable
+            xval    --- a numpy array of independent variable
+            yval    --- a numpy array of dependent variable
     Ouptput: sum    --- evaluated results
             abdev   --- a+b deviation
+    Note:   the median is found with numpy.partition (linear time) instead of a sort
     """
     tot = len(xval)
+#
+#--- the median of y - b x; the two middle values are the same if tot is odd
+#
+    arr = yval - b_in * xval
+    nml = (tot - 1) // 2
+    nmh = tot // 2
+    arr = numpy.partition(arr, [nml, nmh])
+    aa  = 0.5 * (arr[nml] + arr[nmh])
 
-    n1  = tot + 1
-    nm1 = 0.5 * n1
-    nmh = n1  - nm1
-    arr = [0.0 for x in range(0, tot)]
-    for j in range(0, tot):
-        arr[j] = yval[j] - b_in * xval[j]
-
-    arr.sort(key=float)
-    aa  = 0.5 * (arr[int(nm1)] + arr[int(nmh)])
-    sum = 0.0
-    abdev = 0.0
-    for j in range(0, tot):
-        d      = yval[j] - (b_in * xval[j] + aa)
-        abdev += abs(d)
-        sum   += xval[j] * sign(1.0, d)
+    d     = yval - (b_in * xval + aa)
+    abdev = numpy.abs(d).sum()
+    sum   = numpy.where(d >= 0, xval, -xval).sum()
 
     return (sum, abdev)
 
@@ -216,44 +925,353 @@ def sign(e1, e2):
 
     return sign * e1
 
+#-------------------------------------------------------------------------------------------
+#-- medfit_batch: fit straight lines to many data sets at once according to robust fit    --
+#-------------------------------------------------------------------------------------------
+
+def medfit_batch(xval, yval, maxiter=100):
+    """
+    fit straight lines to many data sets at once according to robust fit. this is
+    the same algorithm as medfit, but the bracketing and the bisection are done
+    for all rows together
+    Input:  xval    --- 2D array of independent variable (a row for each data set)
+            yval    --- 2D array of dependent variable (the same shape as xval)
+            maxiter --- max # of the bracketing and the bisection steps
+    Output: alpha   --- array of intersects
+            beta    --- array of slopes
+            conv    --- boolean array; False if the row did not converge (or the
+                        least sq. fit was not possible). beta of those rows is the
+                        least sq. slope as medfit does
+    """
+    xval = numpy.atleast_2d(numpy.asarray(xval, dtype=float))
+    yval = numpy.atleast_2d(numpy.asarray(yval, dtype=float))
+    tot  = yval.shape[1]
+#
+#--- first compute least sq. solutions
+#
+    sx  = xval.sum(axis=1)
+    sy  = yval.sum(axis=1)
+    sxy = (xval * yval).sum(axis=1)
+    sxx = (xval * xval).sum(axis=1)
+
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        delta = tot * sxx - sx * sx
+        aa    = (sxx * sy  - sx * sxy) / delta
+        bb    = (tot * sxy - sx * sy)  / delta
+        diff  = yval - (aa[:, numpy.newaxis] + bb[:, numpy.newaxis] * xval)
+        chisq = (diff * diff).sum(axis=1)
+        sigb  = numpy.sqrt(chisq / delta)
+
+    ok    = (delta > 0) & numpy.isfinite(aa) & numpy.isfinite(bb) & numpy.isfinite(sigb)
+    conv  = ok.copy()
+    beta  = bb.copy()
+    rows  = numpy.flatnonzero(ok)
+    if len(rows) == 0:
+        return (aa, beta, conv)
+
+    xv    = xval[rows]
+    yv    = yval[rows]
+    sigb  = sigb[rows]
+#
+#--- bracket the root of rofunc
+#
+    b1    = bb[rows]
+    f1    = rofunc_batch(b1, xv, yv)[0]
+    b2    = b1 + numpy.where(f1 >= 0, 3.0 * sigb, -3.0 * sigb)
+    f2    = rofunc_batch(b2, xv, yv)[0]
+
+    act   = f1 * f2 > 0.0
+    iter  = 0
+    while act.any() and iter < maxiter:
+        k     = numpy.flatnonzero(act)
+        bnew  = 2.0 * b2[k] - b1[k]
+        b1[k] = b2[k]
+        f1[k] = f2[k]
+        b2[k] = bnew
+        f2[k] = rofunc_batch(bnew, xv[k], yv[k])[0]
+        act[k] = f1[k] * f2[k] > 0.0
+        iter  += 1
+
+    failed = act
+#
+#--- bisection
+#
+    bmid  = bb[rows].copy()
+    tol   = 0.01 * sigb
+    act   = numpy.abs(b2 - b1) > tol
+    iter  = 0
+    while act.any():
+        if iter >= maxiter:
+            failed = failed | act
+            break
+
+        k       = numpy.flatnonzero(act)
+        bmid[k] = 0.5 * (b1[k] + b2[k])
+#
+#--- the rows which reached the numerical precision are finished
+#
+        stuck   = (bmid[k] == b1[k]) | (bmid[k] == b2[k])
+        act[k[stuck]] = False
+        k       = k[~stuck]
+
+        f       = rofunc_batch(bmid[k], xv[k], yv[k])[0]
+        same    = f * f1[k] >= 0.0
+        b1[k[same]]  = bmid[k[same]]
+        f1[k[same]]  = f[same]
+        b2[k[~same]] = bmid[k[~same]]
+        f2[k[~same]] = f[~same]
+
+        act[k]  = numpy.abs(b2[k] - b1[k]) > tol[k]
+        iter   += 1
+
+    beta[rows] = numpy.where(failed, bb[rows], bmid)
+    conv[rows] = ~failed
+
+    return (aa, beta, conv)
+
+#-------------------------------------------------------------------------------------------
+#-- rofunc_batch: evaluatate 0 = SUM[ x *sign(y - a bx)] for many data sets at once       --
+#-------------------------------------------------------------------------------------------
+
+def rofunc_batch(b_in, xval, yval):
+    """
+    evaluatate 0 = SUM[ x *sign(y - a bx)] for many data sets at once
+    Input:  b_in    --- array of slopes; one for each row
+            xval    --- 2D array of independent variable
+            yval    --- 2D array of dependent variable
+    Ouptput: sum    --- array of evaluated results
+            abdev   --- array of a+b deviations
+    """
+    tot = yval.shape[1]
+    if len(b_in) == 0:
+        return (numpy.zeros(0), numpy.zeros(0))
+
+    arr = yval - b_in[:, numpy.newaxis] * xval
+    nml = (tot - 1) // 2
+    nmh = tot // 2
+    srt = numpy.partition(arr, [nml, nmh], axis=1)
+    aa  = 0.5 * (srt[:, nml] + srt[:, nmh])
+
+    d     = arr - aa[:, numpy.newaxis]
+    abdev = numpy.abs(d).sum(axis=1)
+    sum   = numpy.where(d >= 0, xval, -xval).sum(axis=1)
+
+    return (sum, abdev)
+
 #-------------------------------------------------------------------------------------------
 #-- find_ebar: find error bar for slope using bootstrapp method                          ---
 #-------------------------------------------------------------------------------------------
 
-def find_ebar(x, y, rounds=100):
+def find_ebar(x, y, rounds=100, seed=None):
     """
     find error bar for slope using bootstrapp method  
     Input:  x   ---- a list of independent variable
             y   ---- a list of dependent variable
             rounds --- how many iterations should be run. default = 100
+            seed   --- seed of the random number generator. default: None (not seeded)
     Output: std ---- a sigma of the slope
+    Note:   the rounds which did not converge are not used; a RuntimeWarning tells
+            how many. see find_ebar_batch to get the # of those rounds
     """
-    tot  = len(x)
-    sum  = 0.0
-    sum2 = 0.0
+    (std, missed) = find_ebar_batch(x, y, rounds=rounds, seed=seed)
+    if missed > 0:
+        warnings.warn('find_ebar: %d of %d bootstrap rounds did not converge and were not used'
+                      % (missed, rounds), RuntimeWarning, stacklevel=2)
 
-    missed = 0
+    return std
 
-    for m in range(0, rounds):
-        xdata = []
-        ydata = []
-        for k in range(0, tot):
-            no = int(tot * random.random())
-            xdata.append(x[no])
-            ydata.append(y[no])
+#-------------------------------------------------------------------------------------------
+#-- find_ebar_theilsen: find error bar for Theil-Sen slope using bootstrapp method        --
+#-------------------------------------------------------------------------------------------
+
+def find_ebar_theilsen(x, y, rounds=100, seed=None):
+    """
+    find error bar for slope of the Theil-Sen estimator using bootstrapp method. 
+    each round is fitted with theil_sen
+    Input:  x   ---- a list (or numpy array) of independent variable
+            y   ---- a list (or numpy array) of dependent variable
+            rounds --- how many iterations should be run. default = 100
+            seed   --- seed of the random number generator. default: None (not seeded)
+    Output: std ---- a sigma of the slope
+    Note:   the rounds which drew only one x value are not used; a RuntimeWarning tells
+            how many
+    """
+    x = numpy.asarray(x, dtype=float)
+    y = numpy.asarray(y, dtype=float)
 
+    rng    = numpy.random.default_rng(seed)
+    tot    = len(x)
+    slopes = []
+    missed = 0
+    for k in range(0, rounds):
+        pos = rng.integers(0, tot, size=tot)
         try:
-            (intc, slope, err) = robust_fit(xdata, ydata, iter=0)
-        except:
+            (alpha, beta) = theil_sen(x[pos], y[pos], seed=rng)
+        except ValueError:
             missed += 1
             continue
-        sum  += slope
-        sum2 += slope * slope
 
-    rounds -= missed
+        slopes.append(beta)
 
-    avg = sum / rounds 
-    std = math.sqrt(sum2 / rounds - avg * avg)
+    if missed > 0:
+        warnings.warn('find_ebar_theilsen: %d of %d bootstrap rounds had only one x value and were not used'
+                      % (missed, rounds), RuntimeWarning, stacklevel=2)
 
-    return std
+    if len(slopes) == 0:
+        return float('nan')
+
+    return float(numpy.std(slopes))
+
+#-------------------------------------------------------------------------------------------
+#-- find_ebar_batch: find error bar for slope using bootstrapp method; all rounds at once  -
+#-------------------------------------------------------------------------------------------
+
+def find_ebar_batch(x, y, rounds=100, seed=None, block=0, nproc=1):
+    """
+    find error bar for slope using bootstrapp method. the resample indices are drawn
+    as 2D arrays (rounds x data size) and the robust slopes of the rounds are 
+    computed together with medfit_batch
+    Input:  x       --- a list (or numpy array) of independent variable
+            y       --- a list (or numpy array) of dependent variable
+            rounds  --- how many iterations should be run. default = 100
+            seed    --- seed of the random numbers. the same seed gives the same 
+                        result. default: None (not seeded)
+            block   --- # of rounds computed at a time to limit the memory use.
+                        default: 0 (up to 100 rounds or about 4 million resampled
+                        points at a time)
+            nproc   --- # of processes. the result does not depend on nproc
+    Output: std     --- a sigma of the slope
+            missed  --- # of the rounds which did not converge; they are not used for std
+    """
+    (good, missed) = find_slope_dist(x, y, rounds, seed, block, nproc)
+
+    if len(good) == 0:
+        return (float('nan'), missed)
+
+    return (float(numpy.std(good)), missed)
+
+#-------------------------------------------------------------------------------------------
+#-- find_slope_dist: find the bootstrap distribution of the slope                        ---
+#-------------------------------------------------------------------------------------------
+
+def find_slope_dist(x, y, rounds=1000, seed=None, block=0, nproc=1):
+    """
+    find the bootstrap distribution of the slope. percentile intervals can be
+    computed from it, e.g. numpy.percentile(slopes, [2.5, 97.5])
+    Input:  x       --- a list (or numpy array) of independent variable
+            y       --- a list (or numpy array) of dependent variable
+            rounds  --- how many iterations should be run. default = 1000
+            seed    --- seed of the random numbers. default: None (not seeded)
+            block   --- # of rounds computed at a time (see find_ebar_batch)
+            nproc   --- # of processes. the rounds are computed in blocks and each
+                        block has its own random number stream, so the result is 
+                        the same for any nproc
+    Output: slopes  --- array of the slopes of the rounds which converged
+            missed  --- # of the rounds which did not converge
+    """
+    x = numpy.asarray(x, dtype=float)
+    y = numpy.asarray(y, dtype=float)
+
+    slopes = bootstrap_slopes(x, y, rounds, seed, block, nproc)
+    good   = slopes[numpy.isfinite(slopes)]
+
+    return (good, rounds - len(good))
+
+#-------------------------------------------------------------------------------------------
+#-- bootstrap_slopes: compute robust slopes of bootstrap resampled data sets              --
+#-------------------------------------------------------------------------------------------
+
+def bootstrap_slopes(x, y, rounds, seed=None, block=0, nproc=1):
+    """
+    compute robust slopes of bootstrap resampled data sets. the rounds are computed
+    in blocks and each block has its own random number stream spawned from the seed
+    Input:  x       --- numpy array of independent variable
+            y       --- numpy array of dependent variable
+            rounds  --- # of rounds
+            seed    --- seed of the random numbers. default: None
+            block   --- # of rounds in a block. default: 0 (up to 100 rounds or 
+                        about 4 million resampled points in a block)
+            nproc   --- # of processes to compute the blocks. default: 1
+    Output: slopes  --- array of the slopes; nan if the round did not converge
+    """
+    tot = len(x)
+    if block <= 0:
+        block = max(1, min(100, 4000000 // max(tot, 1)))
+#
+#--- the blocks and their random number streams do not depend on nproc
+#
+    nblock = (rounds + block - 1) // block
+    sseqs  = numpy.random.SeedSequence(seed).spawn(nblock)
+    tasks  = []
+    for k in range(0, nblock):
+        nrow = min(block, rounds - k * block)
+        tasks.append((nrow, sseqs[k]))
+
+    if nproc > 1 and nblock > 1:
+        with multiprocessing.Pool(min(nproc, nblock), initializer=init_bootstrap_worker,\
+                                  initargs=(x, y)) as pool:
+            slopes = pool.map(bootstrap_worker, tasks)
+    else:
+        slopes = [bootstrap_block(x, y, nrow, sseq) for (nrow, sseq) in tasks]
+
+    if len(slopes) == 0:
+        return numpy.zeros(0)
+
+    return numpy.concatenate(slopes)
+
+#-------------------------------------------------------------------------------------------
+#-- bootstrap_block: compute robust slopes of a block of bootstrap rounds                 --
+#-------------------------------------------------------------------------------------------
+
+def bootstrap_block(x, y, nrow, sseq):
+    """
+    compute robust slopes of a block of bootstrap rounds
+    Input:  x       --- numpy array of independent variable
+            y       --- numpy array of dependent variable
+            nrow    --- # of rounds in the block
+            sseq    --- numpy.random.SeedSequence of the block
+    Output: slopes  --- array of the slopes; nan if the round did not converge
+    """
+    tot   = len(x)
+    rng   = numpy.random.default_rng(sseq)
+    index = rng.integers(0, tot, size=(nrow, tot))
+
+    xs = x[index]
+    ys = y[index]
+    del index
+#
+#--- robust fit works better if the data are centered
+#
+    xs -= xs.mean(axis=1)[:, numpy.newaxis]
+    ys -= ys.mean(axis=1)[:, numpy.newaxis]
+
+    (alpha, beta, conv) = medfit_batch(xs, ys)
+
+    return numpy.where(conv, beta, numpy.nan)
+
+#-------------------------------------------------------------------------------------------
+#-- init_bootstrap_worker: keep the data in a bootstrap worker process                    --
+#-------------------------------------------------------------------------------------------
+
+def init_bootstrap_worker(x, y):
+    """
+    keep the data in a bootstrap worker process so that they are sent only once
+    Input:  x, y    --- numpy arrays of independent and dependent variables
+    Output: bootstrap_data is updated
+    """
+    bootstrap_data['x'] = x
+    bootstrap_data['y'] = y
+
+#-------------------------------------------------------------------------------------------
+#-- bootstrap_worker: compute a block of bootstrap rounds in a worker process             --
+#-------------------------------------------------------------------------------------------
+
+def bootstrap_worker(task):
+    """
+    compute a block of bootstrap rounds in a worker process
+    Input:  task    --- (nrow, sseq); see bootstrap_block
+    Output: slopes  --- array of the slopes; nan if the round did not converge
+    """
+    (nrow, sseq) = task
 
+    return bootstrap_block(bootstrap_data['x'], bootstrap_data['y'], nrow, sseq)